@@ -0,0 +1,430 @@
+import sys
+import os
+import time
+import shutil
+import subprocess
+import tempfile
+import platform
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
+import PIL
+import cv2
+import numpy as np
+from upscaler import (
+    Upscaler, FFmpegWriter, detect_file_type, draft_image, downscale_factor, pyramid_levels, pyramid_resize,
+    image_format_available, use_probe_cache, DOWNSCALE_GAP, DOWNSCALE_SSIM_MIN, IMAGE_FORMATS, IMAGE_PROFILES,
+    PIL_FORMATS
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковую память считаем только там, где есть getrusage
+    resource = None
+
+
+IMAGE_SIZES = [(640, 360), (1920, 1080), (3840, 2160)]
+GIF_SIZES = [(160, 120), (480, 270)]
+# Кодировщики меряются на картинке после апскейла ×2: она глаже исходной синтетики, как и реальные результаты
+ENCODE_SIZES = [(960, 540), (1920, 1080)]
+VIDEO_SIZES = [(640, 360), (1280, 720)]
+# 4K-кадры - отдельно и только в покадровых движках: на них видно, как ресайз больших кадров делит ядра
+LARGE_VIDEO_SIZES = [(3840, 2160)]
+LARGE_VIDEO_FRAMES = 30
+QUICK_SIZES = 1
+
+GIF_FRAMES = 24
+VIDEO_FRAMES = 60
+VIDEO_FPS = 30
+
+SCALES = {"up": 2.0, "down": 0.5, "thumb": 0.15}
+VIDEO_ENGINES = {
+    "ffmpeg": dict(engine="ffmpeg"),
+    "pipeline": dict(engine="opencv", decoder="ffmpeg"),
+    "opencv": dict(engine="opencv", decoder="opencv"),
+}
+GIF_ENGINES = {
+    "shared": dict(gif_engine="shared"),
+    "per-frame": dict(gif_engine="per-frame"),
+}
+
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_REPEAT = 3
+SSIM_FRAMES = 30
+
+
+def synthetic_frame(width, height, index=0, seed=0):
+    # Градиент даёт плавные области, шум - мелкие детали; вместе это похоже на реальный кадр
+    rng = np.random.default_rng(seed + index)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    shift = index * 4
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[..., 0] = (x + shift) % 256
+    frame[..., 1] = (y + shift) % 256
+    frame[..., 2] = (x[None, :] + y) / 2
+    frame += rng.normal(0, 12, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def ssim(a, b):
+    # Классический SSIM (Wang et al.) с гауссовым окном 11x11, усреднённый по каналам
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    covar = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covar + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def read_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def downscale_ssim(source, size):
+    # Сравнивается сам шаг уменьшения, до кодировщика: на миниатюрах шум JPEG/H.264
+    # сопоставим с разницей фильтров и смазал бы оценку
+    if detect_file_type(source) == 'image':
+        exact = Image.open(source).resize(size, Image.Resampling.LANCZOS)
+        fast = draft_image(Image.open(source), size).resize(
+            size, Image.Resampling.LANCZOS, reducing_gap=DOWNSCALE_GAP
+        )
+        return round(ssim(np.asarray(exact), np.asarray(fast)), 4)
+
+    frames = read_frames(source, SSIM_FRAMES)
+    if not frames:
+        return None
+    levels = pyramid_levels((frames[0].shape[1], frames[0].shape[0]), size)
+    return round(min(
+        ssim(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), pyramid_resize(frame, size, levels))
+        for frame in frames
+    ), 4)
+
+
+def uses_fast_downscale(case, width, height):
+    file_type = detect_file_type(case["source"])
+    if file_type == 'image':
+        return downscale_factor(case["size"], (width, height)) >= 2
+    if file_type == 'video':
+        return case["options"].get("engine") != "ffmpeg" and pyramid_levels(case["size"], (width, height)) > 0
+    return False
+
+
+def make_image(path, width, height):
+    Image.fromarray(synthetic_frame(width, height)[..., ::-1]).save(path)
+
+
+def make_gif(path, width, height, frames=GIF_FRAMES):
+    images = [
+        Image.fromarray(synthetic_frame(width, height, index)[..., ::-1]).quantize(256)
+        for index in range(frames)
+    ]
+    images[0].save(path, save_all=True, append_images=images[1:], loop=0, duration=40)
+
+
+def make_video(path, width, height, frames=VIDEO_FRAMES, fps=VIDEO_FPS):
+    if shutil.which("ffmpeg"):
+        out = FFmpegWriter(path, width, height, fps, preset="veryfast")
+    else:
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for index in range(frames):
+        out.write(synthetic_frame(width, height, index))
+    out.release()
+
+
+def build_cases(quick=False):
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+    limit = QUICK_SIZES if quick else None
+    cases = []
+
+    for width, height in IMAGE_SIZES[:limit]:
+        for ext in ("png", "jpg"):
+            for mode, scale in SCALES.items():
+                cases.append(dict(
+                    name=f"image-{ext}-{width}x{height}-{mode}",
+                    source=f"image_{width}x{height}.{ext}",
+                    size=(width, height), scale=scale, options={}
+                ))
+
+    for width, height in ENCODE_SIZES[:limit]:
+        for image_format, suffix in IMAGE_FORMATS.items():
+            if not image_format_available(PIL_FORMATS[suffix]):
+                continue
+            for profile in IMAGE_PROFILES:
+                cases.append(dict(
+                    name=f"encode-{image_format}-{profile}-{width}x{height}",
+                    source=f"image_{width}x{height}.png",
+                    size=(width, height), scale=2.0, suffix=suffix,
+                    options=dict(image_profile=profile)
+                ))
+
+    for width, height in GIF_SIZES[:limit]:
+        for mode, scale in SCALES.items():
+            for engine, options in GIF_ENGINES.items():
+                cases.append(dict(
+                    name=f"gif-{width}x{height}-{mode}-{engine}",
+                    source=f"anim_{width}x{height}.gif",
+                    size=(width, height), scale=scale, options=options
+                ))
+
+    for width, height in VIDEO_SIZES[:limit]:
+        for mode, scale in SCALES.items():
+            for engine, options in VIDEO_ENGINES.items():
+                if not has_ffmpeg and engine != "opencv":
+                    continue
+                cases.append(dict(
+                    name=f"video-{width}x{height}-{mode}-{engine}",
+                    source=f"video_{width}x{height}.mp4",
+                    size=(width, height), scale=scale, options=options
+                ))
+
+    if not quick:
+        for width, height in LARGE_VIDEO_SIZES:
+            for engine in ("pipeline", "opencv"):
+                if not has_ffmpeg and engine != "opencv":
+                    continue
+                cases.append(dict(
+                    name=f"video-{width}x{height}-down-{engine}",
+                    source=f"video_{width}x{height}.mp4",
+                    size=(width, height), scale=SCALES["down"], options=VIDEO_ENGINES[engine],
+                    frames=LARGE_VIDEO_FRAMES
+                ))
+    return cases
+
+
+def prepare_media(cases, work_dir):
+    use_probe_cache(None)
+    for case in cases:
+        path = os.path.join(work_dir, case["source"])
+        if os.path.exists(path):
+            continue
+        width, height = case["size"]
+        file_type = detect_file_type(path)
+        if file_type == 'image':
+            make_image(path, width, height)
+        elif file_type == 'gif':
+            make_gif(path, width, height)
+        else:
+            make_video(path, width, height, case.get("frames", VIDEO_FRAMES))
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None, None
+    # Linux отдаёт килобайты, macOS - байты
+    unit = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return round(own / 2**20, 1), round(children / 2**20, 1)
+
+
+def run_case(case, work_dir, repeat):
+    # Синтетика живёт во временной папке - её сведениям не место в общем кэше пользователя
+    use_probe_cache(None)
+    source = os.path.join(work_dir, case["source"])
+    width = max(1, round(case["size"][0] * case["scale"]))
+    height = max(1, round(case["size"][1] * case["scale"]))
+    output = os.path.join(work_dir, f"out_{case['name']}{case.get('suffix', Path(source).suffix)}")
+
+    times = []
+    frames = 0
+    for _ in range(repeat):
+        upscaler = Upscaler(source, output, width, height, detect_file_type(source), **case["options"])
+        started = time.perf_counter()
+        upscaler.run()
+        times.append(time.perf_counter() - started)
+        frames = max(1, upscaler.telemetry.snapshot()["frames"])
+
+    quality = None
+    if uses_fast_downscale(case, width, height):
+        quality = downscale_ssim(source, (width, height))
+    output_bytes = os.path.getsize(output)
+    os.remove(output)
+    profile = upscaler.stats.get("profile", {})
+
+    # Лучшее из повторов меньше всего зависит от фонового шума системы
+    seconds = min(times)
+    rss, child_rss = peak_rss_mb()
+    return {
+        "seconds": round(seconds, 4),
+        "frames": frames,
+        "fps": round(frames / seconds, 2),
+        "mpps": round(width * height * frames / 1e6 / seconds, 2),
+        "peak_rss_mb": rss,
+        "peak_child_rss_mb": child_rss,
+        "width": width,
+        "height": height,
+        "ssim": quality,
+        "bytes": output_bytes,
+        "encode_seconds": profile.get("save", {}).get("total"),
+        "resize_seconds": profile.get("resize", {}).get("total"),
+        "profile": profile,
+    }
+
+
+def ffmpeg_version():
+    if not shutil.which("ffmpeg"):
+        return None
+    output = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split()
+    return output[2] if len(output) > 2 else None
+
+
+def run_benchmark(cases, work_dir, repeat):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        # Каждый случай - в свежем процессе, иначе пиковая память одного теста перетечёт в следующий
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                result = executor.submit(run_case, case, work_dir, repeat).result()
+            except Exception as e:
+                result = {"error": str(e)}
+        results[case["name"]] = result
+        print(format_result(case["name"], result), flush=True)
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "pillow": PIL.__version__,
+            "numpy": np.__version__,
+            "ffmpeg": ffmpeg_version(),
+            "repeat": repeat,
+        },
+        "cases": results,
+    }
+
+
+def format_result(name, result):
+    if "error" in result:
+        return f"{name:<36} ОШИБКА: {result['error']}"
+    rss = f"{result['peak_rss_mb']:.0f} МБ" if result["peak_rss_mb"] is not None else "--"
+    quality = f"   SSIM {result['ssim']:.4f}" if result.get("ssim") is not None else ""
+    encode = ""
+    if result.get("encode_seconds") is not None:
+        encode = f"   кодирование {result['encode_seconds']:.3f} с, {result['bytes'] / 1024:.0f} КБ"
+    elif result.get("resize_seconds") is not None:
+        encode = f"   ресайз {result['resize_seconds']:.3f} с"
+    return (
+        f"{name:<36} {result['seconds']:>8.3f} с {result['fps']:>9.1f} кадр/с "
+        f"{result['mpps']:>8.1f} Мп/с   RSS {rss}{quality}{encode}"
+    )
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base or "error" in base or "error" in result:
+            continue
+        checks = [("fps", result["fps"] < base["fps"] * (1 - threshold))]
+        if result.get("peak_rss_mb") and base.get("peak_rss_mb"):
+            checks.append(("peak_rss_mb", result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold)))
+        for metric, regressed in checks:
+            change = (result[metric] - base[metric]) / base[metric] * 100 if base[metric] else 0.0
+            if regressed:
+                regressions.append({
+                    "case": name, "metric": metric,
+                    "baseline": base[metric], "current": result[metric],
+                    "change_percent": round(change, 1),
+                })
+    return regressions
+
+
+def quality_failures(results):
+    return [
+        name for name, result in results["cases"].items()
+        if result.get("ssim") is not None and result["ssim"] < DOWNSCALE_SSIM_MIN
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Офлайн-бенчмарк апскейла на синтетических изображениях, GIF и видео"
+    )
+    parser.add_argument("--quick", action="store_true", help="только самые маленькие разрешения")
+    parser.add_argument("--filter", default="", help="запускать только случаи, в имени которых есть эта строка")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="сколько раз повторять каждый случай")
+    parser.add_argument("--output", default="benchmark_results.json", help="куда записать результаты")
+    parser.add_argument("--baseline", help="JSON с эталонными результатами для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимое ухудшение, доля (0.10 = 10%%)")
+    parser.add_argument("--save-baseline", help="сохранить результаты ещё и как новый эталон")
+    parser.add_argument("--work-dir", help="папка для синтетических файлов (по умолчанию временная)")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in build_cases(args.quick) if args.filter in case["name"]]
+    if not cases:
+        parser.error("нет случаев под такой фильтр")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="media_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        # Генерация синтетики раздувает память, а пиковый RSS в Linux наследуется дочерними
+        # процессами - поэтому и она идёт в отдельном процессе, иначе исказит замеры случаев
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            executor.submit(prepare_media, cases, work_dir).result()
+        results = run_benchmark(cases, work_dir, max(1, args.repeat))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        results["baseline"] = {"path": args.baseline, "threshold": args.threshold, "regressions": regressions}
+        if regressions:
+            exit_code = 1
+            print(f"\nРегрессии (порог {args.threshold:.0%}):")
+            for item in regressions:
+                print(
+                    f"  {item['case']}: {item['metric']} {item['baseline']} -> {item['current']} "
+                    f"({item['change_percent']:+.1f}%)"
+                )
+        else:
+            print(f"\nРегрессий нет (порог {args.threshold:.0%})")
+
+    failed = [name for name, result in results["cases"].items() if "error" in result]
+    if failed:
+        exit_code = 1
+
+    degraded = quality_failures(results)
+    if degraded:
+        exit_code = 1
+        print(f"\nБыстрое уменьшение хуже точного (SSIM < {DOWNSCALE_SSIM_MIN}): {', '.join(degraded)}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,25 +2,29 @@ import sys
 import os
 import subprocess
 import threading
+import time
+import importlib
+STARTUP_STARTED = time.perf_counter()
 from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout,
     QHBoxLayout, QPushButton, QLabel, QFileDialog,
     QProgressBar, QSpinBox, QGroupBox, QDialog, QLineEdit,
-    QGridLayout, QMessageBox, QStackedWidget, QComboBox, QCheckBox
+    QGridLayout, QMessageBox, QStackedWidget, QComboBox, QCheckBox,
+    QFrame, QScrollArea
 )
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize, QTimer, QPropertyAnimation, QEasingCurve, QPoint
 from PyQt6.QtGui import (
     QFont, QDragEnterEvent, QDropEvent, QIcon, QPixmap, 
     QPainter, QPainterPath, QColor, QPen
 )
-from PIL import Image
-import cv2
-import numpy as np
 import json
-import yt_dlp
 import re
 
+# Тяжёлые модули (OpenCV, numpy, Pillow, сотни экстракторов yt-dlp) грузятся в фоне после старта,
+# а там, где они нужны, импортируются локально - к этому моменту они обычно уже в sys.modules
+HEAVY_MODULES = ["upscaler", "PIL.Image", "yt_dlp"]
+
 
 class IconFactory:
     @staticmethod
@@ -62,6 +66,54 @@ class IconFactory:
         return QIcon(pixmap)
 
 
+class StartupReport:
+    def __init__(self, started):
+        self.started = started
+        self.lock = threading.Lock()
+        self.marks = {}
+        self.imports = {}
+
+    def mark(self, name):
+        with self.lock:
+            self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def record_import(self, name, seconds):
+        with self.lock:
+            self.imports[name] = seconds
+
+    def is_complete(self):
+        with self.lock:
+            return "interactive" in self.marks and "warmup" in self.marks
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "marks": {name: round(value, 4) for name, value in self.marks.items()},
+                "imports": {name: round(value, 4) for name, value in self.imports.items()},
+            }
+
+    def format(self):
+        data = self.as_dict()
+        lines = ["Запуск (секунды от старта процесса):"]
+        for name, value in sorted(data["marks"].items(), key=lambda item: item[1]):
+            lines.append(f"  {name:<16} {value:7.3f}")
+        for name, value in data["imports"].items():
+            lines.append(f"  import {name:<9} {value:7.3f} (в фоне)")
+        return "\n".join(lines)
+
+
+def warm_up_modules(report):
+    for name in HEAVY_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Пусть ошибку покажет то место, где модуль реально понадобится
+            pass
+        report.record_import(name, time.perf_counter() - started)
+    report.mark("warmup")
+
+
 class LoadingScreen(QWidget):
     def __init__(self):
         super().__init__()
@@ -112,9 +164,21 @@ class LoadingScreen(QWidget):
         self.dot_count += 1
 
 
+DEFAULT_MAX_JOBS = 2
+DEFAULT_CACHE_LIMIT_GB = 2
+DEFAULT_WATCH_TARGET = "2"
+WATCH_THREAD_TIMEOUT = 0.5
+# Сначала дешёвые задачи: картинка не должна ждать двухчасовой рендер
+JOB_PRIORITY = {'image': 0, 'gif': 1, 'video': 2}
+JOB_LIST_WINDOW_HEIGHT = 900
+IMAGE_FORMAT_NAMES = {"": "Как у исходника", "png": "PNG", "jpeg": "JPEG", "webp": "WebP", "avif": "AVIF"}
+IMAGE_PROFILE_NAMES = {"quality": "Качество", "fast": "Быстрее", "balanced": "Баланс", "smallest": "Меньше размер"}
+
+
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
+        from upscaler import VIDEO_CODECS, VIDEO_PRESETS, IMAGE_FORMATS, PIL_FORMATS, image_format_available
         self.setWindowTitle("Настройки")
         self.setMinimumWidth(500)
         self.setModal(True)
@@ -169,6 +233,38 @@ class SettingsDialog(QDialog):
             QPushButton#cancelBtn:hover {
                 background: rgba(48, 54, 61, 220);
             }
+            QCheckBox {
+                color: #c9d1d9;
+                font-size: 14px;
+                background: transparent;
+            }
+            QCheckBox::indicator {
+                width: 20px;
+                height: 20px;
+                border-radius: 4px;
+                border: 2px solid rgba(48, 54, 61, 150);
+                background: rgba(22, 27, 34, 200);
+            }
+            QCheckBox::indicator:checked {
+                background: rgba(88, 166, 255, 200);
+                border: 2px solid rgba(88, 166, 255, 200);
+            }
+            QComboBox {
+                background: rgba(22, 27, 34, 200);
+                border: 2px solid rgba(48, 54, 61, 150);
+                border-radius: 8px;
+                padding: 4px 8px;
+                color: #c9d1d9;
+                font-size: 14px;
+            }
+            QComboBox:focus {
+                border: 2px solid rgba(88, 166, 255, 200);
+            }
+            QComboBox QAbstractItemView {
+                background: rgba(22, 27, 34, 245);
+                color: #c9d1d9;
+                selection-background-color: rgba(88, 166, 255, 100);
+            }
         """)
         
         layout = QVBoxLayout(self)
@@ -226,6 +322,129 @@ class SettingsDialog(QDialog):
         folder_input_layout.addWidget(browse_btn)
 
         layout.addLayout(folder_input_layout)
+
+        layout.addSpacing(20)
+
+        processing_title = QLabel("Обработка")
+        processing_title.setFont(QFont('Bahnschrift', 18, QFont.Weight.Bold))
+        processing_title.setStyleSheet("color: #58a6ff; margin-bottom: 5px;")
+        layout.addWidget(processing_title)
+
+        self.parallel_check = QCheckBox("Параллельная обработка видео по сегментам")
+        layout.addWidget(self.parallel_check)
+
+        self.resumable_check = QCheckBox("Возобновлять прерванную обработку видео")
+        layout.addWidget(self.resumable_check)
+
+        self.dedupe_check = QCheckBox("Не пересчитывать повторяющиеся кадры")
+        layout.addWidget(self.dedupe_check)
+
+        self.fast_downscale_check = QCheckBox("Быстрое уменьшение (в несколько шагов)")
+        self.fast_downscale_check.setChecked(True)
+        layout.addWidget(self.fast_downscale_check)
+
+        self.trace_check = QCheckBox("Сохранять трассировку этапов (.trace.json)")
+        layout.addWidget(self.trace_check)
+
+        encoder_layout = QHBoxLayout()
+        encoder_layout.setSpacing(10)
+
+        codec_label = QLabel("Кодек:")
+        encoder_layout.addWidget(codec_label)
+        self.codec_combo = QComboBox()
+        self.codec_combo.addItems(list(VIDEO_CODECS.keys()))
+        encoder_layout.addWidget(self.codec_combo, 1)
+
+        preset_label = QLabel("Пресет:")
+        encoder_layout.addWidget(preset_label)
+        self.preset_combo = QComboBox()
+        self.preset_combo.addItems(VIDEO_PRESETS)
+        self.preset_combo.setCurrentText("medium")
+        encoder_layout.addWidget(self.preset_combo, 1)
+
+        layout.addLayout(encoder_layout)
+
+        image_layout = QHBoxLayout()
+        image_layout.setSpacing(10)
+
+        format_label = QLabel("Картинки:")
+        image_layout.addWidget(format_label)
+        self.format_combo = QComboBox()
+        for value, name in IMAGE_FORMAT_NAMES.items():
+            if not value or image_format_available(PIL_FORMATS[IMAGE_FORMATS[value]]):
+                self.format_combo.addItem(name, value)
+        image_layout.addWidget(self.format_combo, 1)
+
+        profile_label = QLabel("Сжатие:")
+        image_layout.addWidget(profile_label)
+        self.profile_combo = QComboBox()
+        for value, name in IMAGE_PROFILE_NAMES.items():
+            self.profile_combo.addItem(name, value)
+        image_layout.addWidget(self.profile_combo, 1)
+
+        layout.addLayout(image_layout)
+
+        jobs_layout = QHBoxLayout()
+        jobs_layout.setSpacing(10)
+
+        jobs_label = QLabel("Одновременных задач:")
+        jobs_layout.addWidget(jobs_label)
+        self.jobs_spin = QSpinBox()
+        self.jobs_spin.setRange(1, 16)
+        self.jobs_spin.setValue(DEFAULT_MAX_JOBS)
+        jobs_layout.addWidget(self.jobs_spin, 1)
+
+        layout.addLayout(jobs_layout)
+
+        cache_layout = QHBoxLayout()
+        cache_layout.setSpacing(10)
+
+        self.cache_check = QCheckBox("Кэшировать результаты, ГБ:")
+        self.cache_check.setChecked(True)
+        cache_layout.addWidget(self.cache_check)
+        self.cache_spin = QSpinBox()
+        self.cache_spin.setRange(1, 100)
+        self.cache_spin.setValue(DEFAULT_CACHE_LIMIT_GB)
+        cache_layout.addWidget(self.cache_spin, 1)
+
+        layout.addLayout(cache_layout)
+
+        layout.addSpacing(20)
+
+        watch_title = QLabel("Папка наблюдения")
+        watch_title.setFont(QFont('Bahnschrift', 18, QFont.Weight.Bold))
+        watch_title.setStyleSheet("color: #58a6ff; margin-bottom: 5px;")
+        layout.addWidget(watch_title)
+
+        self.watch_check = QCheckBox("Автоматически обрабатывать новые файлы из папки")
+        layout.addWidget(self.watch_check)
+
+        watch_input_layout = QHBoxLayout()
+        watch_input_layout.setSpacing(10)
+
+        self.watch_input = QLineEdit()
+        self.watch_input.setPlaceholderText("Выберите папку для наблюдения...")
+        self.watch_input.setReadOnly(True)
+        watch_input_layout.addWidget(self.watch_input)
+
+        watch_browse_btn = QPushButton("Обзор")
+        watch_browse_btn.setObjectName("browseBtn")
+        watch_browse_btn.clicked.connect(self.browse_watch_folder)
+        watch_input_layout.addWidget(watch_browse_btn)
+
+        layout.addLayout(watch_input_layout)
+
+        watch_target_layout = QHBoxLayout()
+        watch_target_layout.setSpacing(10)
+
+        watch_target_label = QLabel("Размер:")
+        watch_target_layout.addWidget(watch_target_label)
+        self.watch_target_input = QLineEdit(DEFAULT_WATCH_TARGET)
+        self.watch_target_input.setPlaceholderText("множитель (2, 0.5) или размер (1920x1080, 1920x0)")
+        watch_target_layout.addWidget(self.watch_target_input, 1)
+
+        layout.addLayout(watch_target_layout)
+
         layout.addStretch()
         
         buttons_layout = QHBoxLayout()
@@ -307,6 +526,7 @@ class SettingsDialog(QDialog):
         )
         if file_path:
             try:
+                from PIL import Image
                 img = Image.open(file_path)
                 img = img.convert('RGB')
                 img.thumbnail((500, 500))
@@ -320,28 +540,143 @@ class SettingsDialog(QDialog):
         if folder:
             self.folder_input.setText(folder)
 
+    def browse_watch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Выберите папку для наблюдения")
+        if folder:
+            self.watch_input.setText(folder)
+
+    def accept(self):
+        from upscaler import parse_target
+        try:
+            if self.get_watch_enabled():
+                parse_target(self.get_watch_target())
+        except Exception as e:
+            QMessageBox.warning(self, "Папка наблюдения", str(e))
+            return
+        super().accept()
+
     def load_settings(self):
         if os.path.exists('settings.json'):
             try:
                 with open('settings.json', 'r', encoding='utf-8') as f:
                     settings = json.load(f)
                     self.folder_input.setText(settings.get('output_folder', ''))
+                    self.parallel_check.setChecked(settings.get('video_parallel', False))
+                    self.resumable_check.setChecked(settings.get('video_resumable', False))
+                    self.dedupe_check.setChecked(settings.get('video_dedupe', False))
+                    self.fast_downscale_check.setChecked(settings.get('fast_downscale', True))
+                    self.trace_check.setChecked(settings.get('profile_trace', False))
+                    from upscaler import VIDEO_CODECS
+                    codec = settings.get('video_codec', 'libx264')
+                    for name, value in VIDEO_CODECS.items():
+                        if value == codec:
+                            self.codec_combo.setCurrentText(name)
+                    self.preset_combo.setCurrentText(settings.get('video_preset', 'medium'))
+                    format_index = self.format_combo.findData(settings.get('image_format', ''))
+                    self.format_combo.setCurrentIndex(max(0, format_index))
+                    profile_index = self.profile_combo.findData(settings.get('image_profile', 'quality'))
+                    self.profile_combo.setCurrentIndex(max(0, profile_index))
+                    self.jobs_spin.setValue(settings.get('max_jobs', DEFAULT_MAX_JOBS))
+                    self.cache_check.setChecked(settings.get('cache_enabled', True))
+                    self.cache_spin.setValue(settings.get('cache_limit_gb', DEFAULT_CACHE_LIMIT_GB))
+                    self.watch_check.setChecked(settings.get('watch_enabled', False))
+                    self.watch_input.setText(settings.get('watch_folder', ''))
+                    self.watch_target_input.setText(settings.get('watch_target', DEFAULT_WATCH_TARGET))
             except:
                 pass
 
     def save_settings(self):
-        settings = {
-            'output_folder': self.folder_input.text()
-        }
+        settings = {}
+        if os.path.exists('settings.json'):
+            try:
+                with open('settings.json', 'r', encoding='utf-8') as f:
+                    settings = json.load(f)
+            except:
+                pass
+        settings['output_folder'] = self.folder_input.text()
+        settings['video_parallel'] = self.parallel_check.isChecked()
+        settings['video_resumable'] = self.resumable_check.isChecked()
+        settings['video_dedupe'] = self.dedupe_check.isChecked()
+        settings['fast_downscale'] = self.fast_downscale_check.isChecked()
+        settings['profile_trace'] = self.trace_check.isChecked()
+        settings['video_codec'] = self.get_video_codec()
+        settings['video_preset'] = self.get_video_preset()
+        settings['image_format'] = self.get_image_format()
+        settings['image_profile'] = self.get_image_profile()
+        settings['max_jobs'] = self.get_max_jobs()
+        settings['cache_enabled'] = self.get_cache_enabled()
+        settings['cache_limit_gb'] = self.get_cache_limit_gb()
+        settings['watch_enabled'] = self.get_watch_enabled()
+        settings['watch_folder'] = self.get_watch_folder()
+        settings['watch_target'] = self.get_watch_target()
         with open('settings.json', 'w', encoding='utf-8') as f:
             json.dump(settings, f, ensure_ascii=False, indent=2)
 
     def get_output_folder(self):
         return self.folder_input.text()
 
+    def get_video_parallel(self):
+        return self.parallel_check.isChecked()
+
+    def get_video_resumable(self):
+        return self.resumable_check.isChecked()
+
+    def get_video_dedupe(self):
+        return self.dedupe_check.isChecked()
+
+    def get_fast_downscale(self):
+        return self.fast_downscale_check.isChecked()
+
+    def get_profile_trace(self):
+        return self.trace_check.isChecked()
+
+    def get_video_codec(self):
+        from upscaler import VIDEO_CODECS
+        return VIDEO_CODECS[self.codec_combo.currentText()]
+
+    def get_video_preset(self):
+        return self.preset_combo.currentText()
+
+    def get_image_format(self):
+        return self.format_combo.currentData()
+
+    def get_image_profile(self):
+        return self.profile_combo.currentData()
+
+    def get_max_jobs(self):
+        return self.jobs_spin.value()
+
+    def get_cache_enabled(self):
+        return self.cache_check.isChecked()
+
+    def get_cache_limit_gb(self):
+        return self.cache_spin.value()
+
+    def get_watch_enabled(self):
+        return self.watch_check.isChecked()
+
+    def get_watch_folder(self):
+        return self.watch_input.text()
+
+    def get_watch_target(self):
+        return self.watch_target_input.text().strip()
+
+
+TELEMETRY_POLL_MS = 100
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
 
 class DownloadThread(QThread):
-    progress = pyqtSignal(dict)
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
     
@@ -352,25 +687,15 @@ class DownloadThread(QThread):
         self.quality = quality
         self.audio_mode = audio_mode
         self.audio_format = audio_format
+        from upscaler import Telemetry
+        self.telemetry = Telemetry()
         
     def progress_hook(self, d):
         if d['status'] == 'downloading':
             try:
-                total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                downloaded = d.get('downloaded_bytes', 0)
-                speed = d.get('speed', 0)
-                
-                if total > 0:
-                    percent = int((downloaded / total) * 100)
-                else:
-                    percent = 0
-                
-                self.progress.emit({
-                    'percent': percent,
-                    'speed': speed,
-                    'total': total,
-                    'downloaded': downloaded
-                })
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded = d.get('downloaded_bytes') or 0
+                self.telemetry.update(downloaded, total)
             except Exception as e:
                 print(f"Progress hook error: {e}")
     
@@ -406,6 +731,7 @@ class DownloadThread(QThread):
                 else:
                     ydl_opts['format'] = 'bestvideo*+bestaudio/best'
             
+            import yt_dlp
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 ydl.download([self.url])
             
@@ -415,170 +741,63 @@ class DownloadThread(QThread):
 
 
 class UpscaleThread(QThread):
-    progress = pyqtSignal(int)
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, input_path, output_path, width, height, file_type):
+    def __init__(self, input_path, output_path, width, height, file_type, **options):
         super().__init__()
-        self.input_path = input_path
-        self.output_path = output_path
-        self.width = width
-        self.height = height
+        from upscaler import Upscaler
+        self.upscaler = Upscaler(input_path, output_path, width, height, file_type, **options)
         self.file_type = file_type
+        self.telemetry = self.upscaler.telemetry
+        self.stats = self.upscaler.stats
 
     def run(self):
+        from upscaler import UpscaleError, UpscaleCancelled
         try:
-            if self.file_type in ['image', 'gif']:
-                self.upscale_image()
-            elif self.file_type == 'video':
-                self.upscale_video()
+            self.finished.emit(self.upscaler.run())
+        except UpscaleCancelled:
+            self.cancelled.emit()
+        except UpscaleError as e:
+            self.error.emit(str(e))
         except Exception as e:
             self.error.emit(f"Ошибка: {str(e)}")
 
-    def upscale_image(self):
-        img = Image.open(self.input_path)
-
-        if self.input_path.lower().endswith('.gif'):
-            frames = []
-            try:
-                while True:
-                    frames.append(img.copy())
-                    img.seek(img.tell() + 1)
-            except EOFError:
-                pass
-
-            if not frames:
-                self.error.emit("Не удалось прочитать GIF")
-                return
-
-            resized_frames = []
-            for i, frame in enumerate(frames):
-                resized = frame.resize((self.width, self.height), Image.Resampling.LANCZOS)
-                resized_frames.append(resized)
-                self.progress.emit(int(((i+1) / len(frames)) * 100))
-
-            resized_frames[0].save(
-                self.output_path,
-                save_all=True,
-                append_images=resized_frames[1:],
-                loop=0,
-                duration=img.info.get('duration', 100),
-                optimize=False
-            )
-        else:
-            result = img.resize((self.width, self.height), Image.Resampling.LANCZOS)
-            self.progress.emit(50)
-
-            if self.output_path.lower().endswith(('.jpg', '.jpeg')):
-                result.save(self.output_path, quality=100, subsampling=0)
-            else:
-                result.save(self.output_path, compress_level=1)
-
-            self.progress.emit(100)
-
-        self.finished.emit(self.output_path)
-
-    def upscale_video(self):
-        cap = cv2.VideoCapture(self.input_path)
-        if not cap.isOpened():
-            self.error.emit("Не удалось открыть видеофайл")
-            return
-
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 60.0
-
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        temp_video_path = str(
-            Path(self.output_path).with_name(Path(self.output_path).stem + "_video_tmp.mp4")
-        )
-
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_video_path, fourcc, fps, (self.width, self.height))
-        
-        if not out.isOpened():
-            cap.release()
-            self.error.emit("Не удалось инициализировать VideoWriter (кодек mp4v)")
-            return
 
-        is_upscaling = (self.width > orig_width) or (self.height > orig_height)
-        same_size = (self.width == orig_width) and (self.height == orig_height)
 
-        frame_count = 0
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if same_size:
-                output_frame = frame
-            else:
-                if is_upscaling:
-                    output_frame = cv2.resize(
-                        frame, (self.width, self.height),
-                        interpolation=cv2.INTER_LANCZOS4
-                    )
-                else:
-                    output_frame = cv2.resize(
-                        frame, (self.width, self.height),
-                        interpolation=cv2.INTER_AREA
-                    )
+class WatchThread(QThread):
+    fileReady = pyqtSignal(str, int, int, str)
+    failed = pyqtSignal(str)
 
-            out.write(output_frame)
-
-            frame_count += 1
-            if total_frames > 0:
-                progress = int((frame_count / total_frames) * 100)
-                self.progress.emit(progress)
-
-        cap.release()
-        out.release()
+    def __init__(self, folder, target):
+        super().__init__()
+        from upscaler import FolderWatcher, parse_target
+        self.size, self.scale = parse_target(target)
+        self.watcher = FolderWatcher(folder)
 
+    def run(self):
+        from upscaler import detect_file_type, media_size, target_size
         try:
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i", temp_video_path,
-                "-i", self.input_path,
-                "-map", "0:v:0",
-                "-map", "1:a:0?",
-                "-c:v", "copy",
-                "-shortest",
-                self.output_path
-            ]
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-
-            if result.returncode != 0:
-                if not os.path.exists(self.output_path):
-                    os.replace(temp_video_path, self.output_path)
-        except FileNotFoundError:
-            if not os.path.exists(self.output_path):
-                try:
-                    os.replace(temp_video_path, self.output_path)
-                except Exception:
-                    pass
+            while not self.isInterruptionRequested():
+                for path in self.watcher.poll(WATCH_THREAD_TIMEOUT):
+                    try:
+                        file_type = detect_file_type(path)
+                        width, height = target_size(media_size(path, file_type), self.size, self.scale)
+                    except Exception as e:
+                        # Нечитаемый файл не берём снова, пока он не изменится
+                        self.watcher.mark_done(path)
+                        self.failed.emit(f"{Path(path).name}: {e}")
+                        continue
+                    self.fileReady.emit(path, width, height, file_type)
+        except OSError as e:
+            self.failed.emit(f"Папка наблюдения недоступна: {e}")
         finally:
-            if os.path.exists(temp_video_path):
-                try:
-                    os.remove(temp_video_path)
-                except Exception:
-                    pass
-
-        self.progress.emit(100)
-        self.finished.emit(self.output_path)
+            self.watcher.close()
 
 
 class DropArea(QLabel):
-    fileDropped = pyqtSignal(str)
+    filesDropped = pyqtSignal(list)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -587,7 +806,7 @@ class DropArea(QLabel):
         self.setMinimumHeight(120)
         self.setMaximumHeight(140)
         self.update_style(False)
-        self.setText("Перетащите файл сюда")
+        self.setText("Перетащите файлы сюда")
 
     def update_style(self, hover=False):
         if hover:
@@ -622,12 +841,92 @@ class DropArea(QLabel):
         self.update_style(False)
 
     def dropEvent(self, event: QDropEvent):
-        files = [u.toLocalFile() for u in event.mimeData().urls()]
+        files = [u.toLocalFile() for u in event.mimeData().urls() if u.isLocalFile()]
         if files:
-            self.fileDropped.emit(files[0])
+            self.filesDropped.emit(files)
         self.update_style(False)
 
 
+class UpscaleJob:
+    def __init__(self, order, input_path, output_path, width, height, file_type):
+        self.order = order
+        self.input_path = input_path
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.file_type = file_type
+        self.watched = False
+        self.start_time = None
+        self.end_time = None
+        self.ladder = []
+        self.state = "queued"
+        self.thread = None
+        self.widget = None
+
+
+class JobWidget(QFrame):
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.setObjectName("jobCard")
+
+        layout = QGridLayout(self)
+        layout.setContentsMargins(12, 8, 12, 8)
+        layout.setHorizontalSpacing(10)
+        layout.setVerticalSpacing(4)
+        layout.setColumnStretch(0, 1)
+
+        self.name_label = QLabel(f"{Path(job.input_path).name} → {job.width}x{job.height}")
+        self.name_label.setStyleSheet("font-size: 14px; font-weight: bold; color: #c9d1d9;")
+        layout.addWidget(self.name_label, 0, 0)
+
+        self.retry_btn = QPushButton("Повторить")
+        self.retry_btn.setObjectName("jobBtn")
+        layout.addWidget(self.retry_btn, 0, 1)
+
+        self.cancel_btn = QPushButton("Отмена")
+        self.cancel_btn.setObjectName("jobCancelBtn")
+        layout.addWidget(self.cancel_btn, 0, 2)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setObjectName("jobProgress")
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.setFixedHeight(8)
+        layout.addWidget(self.progress_bar, 1, 0, 1, 3)
+
+        self.info_label = QLabel("")
+        self.info_label.setStyleSheet("font-size: 12px; color: #8b949e;")
+        self.info_label.setWordWrap(True)
+        layout.addWidget(self.info_label, 2, 0, 1, 3)
+
+        self.set_state(job.state)
+
+    def set_state(self, state, text=None):
+        colors = {
+            "queued": "#8b949e",
+            "running": "#f0883e",
+            "cancelling": "#f0883e",
+            "done": "#3fb950",
+            "error": "#f85149",
+            "cancelled": "#8b949e",
+        }
+        default_texts = {
+            "queued": "В очереди",
+            "running": "Обработка...",
+            "cancelling": "Отмена...",
+            "done": "Готово",
+            "error": "Ошибка",
+            "cancelled": "Отменено",
+        }
+        self.info_label.setText(text or default_texts[state])
+        self.info_label.setStyleSheet(f"font-size: 12px; color: {colors[state]};")
+        self.cancel_btn.setVisible(state in ("queued", "running"))
+        self.retry_btn.setVisible(state in ("error", "cancelled"))
+        if state == "queued":
+            self.progress_bar.setValue(0)
+        elif state == "done":
+            self.progress_bar.setValue(100)
+
+
 class SegmentedButton(QWidget):
     button_clicked = pyqtSignal(str)
 
@@ -679,19 +978,57 @@ class SegmentedButton(QWidget):
 class MediaUpscaler(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.current_file = None
+        self.current_files = []
         self.original_width = 0
         self.original_height = 0
+        self.jobs = []
+        self.job_counter = 0
+        self.max_jobs = DEFAULT_MAX_JOBS
         self.output_folder = ""
+        self.video_parallel = False
+        self.video_resumable = False
+        self.video_dedupe = False
+        self.fast_downscale = True
+        self.profile_trace = False
+        self.video_codec = "libx264"
+        self.video_preset = "medium"
+        self.image_format = ""
+        self.image_profile = "quality"
+        self.cache_enabled = True
+        self.cache_limit_gb = DEFAULT_CACHE_LIMIT_GB
+        self.watch_enabled = False
+        self.watch_folder = ""
+        self.watch_target = DEFAULT_WATCH_TARGET
+        self.watch_thread = None
+        self.watch_config = None
         self.load_settings()
         self.init_ui()
 
+        self.telemetry_timer = QTimer(self)
+        self.telemetry_timer.timeout.connect(self.poll_telemetry)
+        self.update_watcher()
+
     def load_settings(self):
         if os.path.exists('settings.json'):
             try:
                 with open('settings.json', 'r', encoding='utf-8') as f:
                     settings = json.load(f)
                     self.output_folder = settings.get('output_folder', '')
+                    self.video_parallel = settings.get('video_parallel', False)
+                    self.video_resumable = settings.get('video_resumable', False)
+                    self.video_dedupe = settings.get('video_dedupe', False)
+                    self.fast_downscale = settings.get('fast_downscale', True)
+                    self.profile_trace = settings.get('profile_trace', False)
+                    self.video_codec = settings.get('video_codec', 'libx264')
+                    self.video_preset = settings.get('video_preset', 'medium')
+                    self.image_format = settings.get('image_format', '')
+                    self.image_profile = settings.get('image_profile', 'quality')
+                    self.max_jobs = settings.get('max_jobs', DEFAULT_MAX_JOBS)
+                    self.cache_enabled = settings.get('cache_enabled', True)
+                    self.cache_limit_gb = settings.get('cache_limit_gb', DEFAULT_CACHE_LIMIT_GB)
+                    self.watch_enabled = settings.get('watch_enabled', False)
+                    self.watch_folder = settings.get('watch_folder', '')
+                    self.watch_target = settings.get('watch_target', DEFAULT_WATCH_TARGET)
             except:
                 pass
 
@@ -894,6 +1231,51 @@ class MediaUpscaler(QMainWindow):
             QPushButton#cancelBtn:hover {
                 background: rgba(248, 81, 73, 200);
             }
+            QScrollArea#jobList {
+                background: transparent;
+                border: none;
+            }
+            QWidget#jobListContent {
+                background: transparent;
+            }
+            QFrame#jobCard {
+                background: rgba(22, 27, 34, 150);
+                border: 2px solid rgba(48, 54, 61, 150);
+                border-radius: 10px;
+            }
+            QPushButton#jobBtn, QPushButton#jobCancelBtn {
+                background: rgba(33, 38, 45, 200);
+                color: #c9d1d9;
+                padding: 4px 12px;
+                border-radius: 6px;
+                font-size: 13px;
+            }
+            QPushButton#jobBtn:hover {
+                background: rgba(48, 54, 61, 220);
+            }
+            QPushButton#jobCancelBtn:hover {
+                background: rgba(210, 54, 61, 180);
+                color: #ffffff;
+            }
+            QProgressBar#jobProgress {
+                border-radius: 4px;
+            }
+            QProgressBar#jobProgress::chunk {
+                border-radius: 4px;
+            }
+            QScrollArea#jobList QScrollBar:vertical {
+                background: transparent;
+                width: 8px;
+            }
+            QScrollArea#jobList QScrollBar::handle:vertical {
+                background: rgba(48, 54, 61, 200);
+                border-radius: 4px;
+                min-height: 24px;
+            }
+            QScrollArea#jobList QScrollBar::add-line:vertical,
+            QScrollArea#jobList QScrollBar::sub-line:vertical {
+                height: 0;
+            }
         """)
 
         central_widget = QWidget()
@@ -973,16 +1355,17 @@ class MediaUpscaler(QMainWindow):
         layout.setContentsMargins(0, 0, 0, 0)
 
         self.drop_area = DropArea()
-        self.drop_area.fileDropped.connect(self.load_file)
+        self.drop_area.filesDropped.connect(self.load_files)
         layout.addWidget(self.drop_area)
 
-        self.select_btn = QPushButton("Выбрать файл")
+        self.select_btn = QPushButton("Выбрать файлы")
         self.select_btn.clicked.connect(self.select_file)
         layout.addWidget(self.select_btn)
 
         self.file_info = QLabel("Файл не выбран")
         self.file_info.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.file_info.setStyleSheet("color: #8b949e; font-size: 14px;")
+        self.file_info.setWordWrap(True)
         layout.addWidget(self.file_info)
 
         size_group = QGroupBox("Размеры")
@@ -1017,27 +1400,77 @@ class MediaUpscaler(QMainWindow):
         grid.addWidget(height_label, 1, 0)
         grid.addWidget(self.height_spin, 1, 1)
 
+        clip_label = QLabel("Фрагмент:")
+        clip_label.setFixedWidth(100)
+        clip_label.setStyleSheet("font-size: 15px; color: #c9d1d9;")
+
+        clip_layout = QHBoxLayout()
+        clip_layout.setSpacing(10)
+        self.clip_start_input = QLineEdit()
+        self.clip_start_input.setPlaceholderText("начало, например 1:30")
+        self.clip_start_input.setMinimumHeight(45)
+        clip_layout.addWidget(self.clip_start_input)
+        self.clip_end_input = QLineEdit()
+        self.clip_end_input.setPlaceholderText("конец (пусто - до конца)")
+        self.clip_end_input.setMinimumHeight(45)
+        clip_layout.addWidget(self.clip_end_input)
+        self.clip_start_input.setEnabled(False)
+        self.clip_end_input.setEnabled(False)
+
+        grid.addWidget(clip_label, 2, 0)
+        grid.addLayout(clip_layout, 2, 1)
+
+        ladder_label = QLabel("Лестница:")
+        ladder_label.setFixedWidth(100)
+        ladder_label.setStyleSheet("font-size: 15px; color: #c9d1d9;")
+
+        self.ladder_input = QLineEdit()
+        self.ladder_input.setPlaceholderText("высоты для видео за один проход, например 2160, 1080, 720, 480")
+        self.ladder_input.setMinimumHeight(45)
+        self.ladder_input.setEnabled(False)
+
+        grid.addWidget(ladder_label, 3, 0)
+        grid.addWidget(self.ladder_input, 3, 1)
+
         size_group.setLayout(grid)
         layout.addWidget(size_group)
 
-        self.process_btn = QPushButton(" Преобразовать")
+        self.process_btn = QPushButton(" В очередь")
         self.process_btn.setIcon(IconFactory.create_icon("upscaler", QColor("#ffffff")))
         self.process_btn.setIconSize(QSize(32, 32))
         self.process_btn.clicked.connect(self.process_file)
         self.process_btn.setEnabled(False)
         layout.addWidget(self.process_btn)
 
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setVisible(False)
-        layout.addWidget(self.progress_bar)
-
         self.status_label = QLabel("")
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.status_label.setStyleSheet("color: #58a6ff; font-weight: bold; font-size: 14px;")
         self.status_label.setWordWrap(True)
         layout.addWidget(self.status_label)
 
-        layout.addStretch()
+        self.job_list = QScrollArea()
+        self.job_list.setObjectName("jobList")
+        self.job_list.setWidgetResizable(True)
+        self.job_list.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        job_list_content = QWidget()
+        job_list_content.setObjectName("jobListContent")
+        self.job_list_layout = QVBoxLayout(job_list_content)
+        self.job_list_layout.setContentsMargins(0, 0, 0, 0)
+        self.job_list_layout.setSpacing(8)
+        self.job_list_layout.addStretch()
+        self.job_list.setWidget(job_list_content)
+        self.job_list.setMinimumHeight(180)
+        self.job_list.setVisible(False)
+        layout.addWidget(self.job_list, 1)
+
+        self.clear_jobs_btn = QPushButton("Убрать завершённые")
+        self.clear_jobs_btn.setObjectName("jobBtn")
+        self.clear_jobs_btn.clicked.connect(self.clear_finished_jobs)
+        self.clear_jobs_btn.setVisible(False)
+        layout.addWidget(self.clear_jobs_btn, alignment=Qt.AlignmentFlag.AlignRight)
+
+        self.upscaler_stretch = QWidget()
+        layout.addWidget(self.upscaler_stretch, 1)
         return page
 
     def create_downloader_page(self):
@@ -1178,7 +1611,24 @@ class MediaUpscaler(QMainWindow):
         if dialog.exec() == QDialog.DialogCode.Accepted:
             dialog.save_settings()
             self.output_folder = dialog.get_output_folder()
-            self.load_profile_avatar() 
+            self.video_parallel = dialog.get_video_parallel()
+            self.video_resumable = dialog.get_video_resumable()
+            self.video_dedupe = dialog.get_video_dedupe()
+            self.fast_downscale = dialog.get_fast_downscale()
+            self.profile_trace = dialog.get_profile_trace()
+            self.video_codec = dialog.get_video_codec()
+            self.video_preset = dialog.get_video_preset()
+            self.image_format = dialog.get_image_format()
+            self.image_profile = dialog.get_image_profile()
+            self.max_jobs = dialog.get_max_jobs()
+            self.cache_enabled = dialog.get_cache_enabled()
+            self.cache_limit_gb = dialog.get_cache_limit_gb()
+            self.watch_enabled = dialog.get_watch_enabled()
+            self.watch_folder = dialog.get_watch_folder()
+            self.watch_target = dialog.get_watch_target()
+            self.load_profile_avatar()
+            self.update_watcher()
+            self.schedule_jobs()
 
     def load_profile_avatar(self):
         avatar_path = Path("avatar.png")
@@ -1230,102 +1680,354 @@ class MediaUpscaler(QMainWindow):
                 QMessageBox.warning(self, "Ошибка", "Не удалось открыть папку.")
         
     def select_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "Выберите файл",
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Выберите файлы",
             "", "Медиа (*.jpg *.jpeg *.png *.gif *.mp4 *.avi *.mov *.mkv);;Все (*.*)"
         )
-        if file_path:
-            self.load_file(file_path)
-
-    def load_file(self, file_path):
-        self.current_file = file_path
-        filename = Path(file_path).name
-
-        try:
-            ext = Path(file_path).suffix.lower()
-            if ext in ['.jpg', '.jpeg', '.png', '.gif']:
-                img = Image.open(file_path)
-                self.original_width = img.width
-                self.original_height = img.height
-            else:
-                cap = cv2.VideoCapture(file_path)
-                self.original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                self.original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                cap.release()
-        except Exception as e:
-            self.process_error(f"Не удалось прочитать файл: {e}")
+        if file_paths:
+            self.load_files(file_paths)
+
+    def load_files(self, file_paths):
+        from upscaler import probe_media, detect_file_type
+        loaded = []
+        failed = []
+        first_info = None
+        for file_path in file_paths:
+            if not os.path.isfile(file_path):
+                failed.append(f"{Path(file_path).name or file_path} (не файл)")
+                continue
+            try:
+                # Только заголовки, из кэша - мгновенно; точное число кадров досчитается при обработке
+                info = probe_media(file_path, count_frames=False)
+            except Exception:
+                failed.append(Path(file_path).name)
+                continue
+            first_info = first_info or info
+            loaded.append((file_path, info["width"], info["height"]))
+
+        if not loaded:
+            names = ", ".join(failed) if failed else "файлы не найдены"
+            self.status_label.setText(f"Не удалось прочитать файл: {names}")
+            self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
             return
 
+        self.current_files = loaded
+        first_path, self.original_width, self.original_height = loaded[0]
         self.width_spin.setValue(self.original_width)
         self.height_spin.setValue(self.original_height)
-
-        self.file_info.setText(f"Файл: {filename} | {self.original_width}x{self.original_height}")
+        # Фрагмент применяется только к видео
+        has_video = any(detect_file_type(path) == 'video' for path, _, _ in loaded)
+        self.clip_start_input.setEnabled(has_video)
+        self.clip_end_input.setEnabled(has_video)
+        self.ladder_input.setEnabled(has_video)
+
+        filename = Path(first_path).name
+        if len(loaded) == 1:
+            details = ""
+            if first_info["type"] == 'video':
+                details = f" | {first_info['fps']:.2f} к/с | {format_eta(first_info['duration'])}"
+                if first_info["has_audio"] is not None:
+                    details += " | со звуком" if first_info["has_audio"] else " | без звука"
+            self.file_info.setText(f"Файл: {filename} | {self.original_width}x{self.original_height}{details}")
+            self.drop_area.setText(f"✓ {filename}")
+        else:
+            # Размеры задаются по первому файлу, остальные масштабируются в той же пропорции
+            self.file_info.setText(
+                f"Файлов: {len(loaded)} | размеры по {filename} ({self.original_width}x{self.original_height})"
+            )
+            self.drop_area.setText(f"✓ Файлов: {len(loaded)}")
         self.file_info.setStyleSheet("color: #58a6ff; font-size: 14px; font-weight: bold;")
-        self.drop_area.setText(f"✓ {filename}")
         self.process_btn.setEnabled(True)
-        self.status_label.setText("")
+
+        if failed:
+            self.status_label.setText(f"Пропущены: {', '.join(failed)}")
+            self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
+        else:
+            self.update_queue_status()
 
     def process_file(self):
-        if not self.current_file:
+        from upscaler import detect_file_type, parse_time, parse_ladder
+        if not self.current_files:
+            return
+
+        ladder = None
+        if self.ladder_input.isEnabled() and self.ladder_input.text().strip():
+            try:
+                ladder = parse_ladder(self.ladder_input.text())
+            except Exception as e:
+                self.status_label.setText(f"Лестница: {e}")
+                self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
+                return
+
+        try:
+            clip = [
+                parse_time(field.text()) if field.isEnabled() and field.text().strip() else None
+                for field in (self.clip_start_input, self.clip_end_input)
+            ]
+        except Exception as e:
+            self.status_label.setText(f"Фрагмент: {e}")
+            self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
+            return
+        if clip[0] is not None and clip[1] is not None and clip[1] <= clip[0]:
+            self.status_label.setText("Фрагмент: конец должен быть позже начала")
+            self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
             return
 
         width = self.width_spin.value()
         height = self.height_spin.value()
-
-        file_ext = Path(self.current_file).suffix.lower()
-        base_stem = f"{Path(self.current_file).stem}_upscaled"
+        scale_x = width / self.original_width
+        scale_y = height / self.original_height
 
         if self.output_folder and os.path.exists(self.output_folder):
             upscaler_folder = Path(self.output_folder) / "Media Upscaler"
             upscaler_folder.mkdir(exist_ok=True)
             base_dir = upscaler_folder
         else:
-            base_dir = Path(self.current_file).parent
-
-        candidate = base_dir / f"{base_stem}{file_ext}"
-        counter = 1
-        while candidate.exists():
-            candidate = base_dir / f"{base_stem}_{counter}{file_ext}"
-            counter += 1
+            base_dir = None
+
+        for file_path, file_width, file_height in self.current_files:
+            job_width = max(1, round(file_width * scale_x))
+            job_height = max(1, round(file_height * scale_y))
+            file_type = detect_file_type(file_path)
+            if file_type == 'video' and ladder:
+                job = self.add_ladder_job(file_path, (file_width, file_height), ladder, base_dir)
+            else:
+                job = self.add_job(file_path, job_width, job_height, file_type, base_dir)
+            if job.file_type == 'video':
+                job.start_time, job.end_time = clip
+        self.show_job_list()
+        self.schedule_jobs()
+
+    def add_job(self, file_path, width, height, file_type, base_dir, output_path=None):
+        from upscaler import next_output_path, output_suffix
+        # Имена результатов ещё не существующих задач тоже заняты
+        taken = [job.output_path for job in self.jobs if job.state not in ("done", "error", "cancelled")]
+        output_path = output_path or next_output_path(file_path, base_dir, taken, output_suffix(file_path, self.image_format))
+
+        self.job_counter += 1
+        job = UpscaleJob(self.job_counter, file_path, output_path, width, height, file_type)
+        job.widget = JobWidget(job)
+        job.widget.cancel_btn.clicked.connect(lambda _, job=job: self.cancel_job(job))
+        job.widget.retry_btn.clicked.connect(lambda _, job=job: self.retry_job(job))
+        self.job_list_layout.insertWidget(self.job_list_layout.count() - 1, job.widget)
+        self.jobs.append(job)
+        return job
+
+    def add_ladder_job(self, file_path, source_size, heights, base_dir):
+        from upscaler import ladder_sizes, ladder_output_paths
+        # Одна задача на все ступени: видео декодируется один раз, основная ступень - самая большая
+        taken = [
+            path for job in self.jobs if job.state not in ("done", "error", "cancelled")
+            for path in [job.output_path, *(path for _, _, path in job.ladder)]
+        ]
+        paths = ladder_output_paths(file_path, heights, base_dir, taken)
+        sizes = ladder_sizes(source_size, heights)
+        job = self.add_job(file_path, sizes[0][0], sizes[0][1], 'video', base_dir, paths[0])
+        job.ladder = [(width, height, path) for (width, height), path in zip(sizes[1:], paths[1:])]
+        job.widget.name_label.setText(
+            f"{Path(file_path).name} → " + ", ".join(f"{height}p" for height in heights)
+        )
+        return job
+
+    def show_job_list(self):
+        if not self.job_list.isVisible():
+            self.job_list.setVisible(True)
+            self.upscaler_stretch.setVisible(False)
+            self.resize(self.width(), max(self.height(), JOB_LIST_WINDOW_HEIGHT))
+
+    def update_watcher(self):
+        # Настройки сохраняются целиком, но наблюдатель перезапускается, только если изменилось то, что он использует
+        config = (self.watch_enabled, self.watch_folder, self.watch_target)
+        if self.watch_thread is not None and config == self.watch_config:
+            return
+        self.watch_config = config
+        if self.watch_thread is not None:
+            self.watch_thread.requestInterruption()
+            self.watch_thread.wait()
+            self.watch_thread = None
+        if not (self.watch_enabled and self.watch_folder and os.path.isdir(self.watch_folder)):
+            return
+        try:
+            self.watch_thread = WatchThread(self.watch_folder, self.watch_target)
+        except Exception as e:
+            self.status_label.setText(f"Папка наблюдения: {e}")
+            self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
+            return
+        # Новый наблюдатель не знает, что уже стоит в очереди от прежнего - иначе выдал бы эти файлы снова
+        for job in self.jobs:
+            if job.watched and job.state in ("queued", "running", "cancelling"):
+                self.watch_thread.watcher.hold(job.input_path)
+        self.watch_thread.fileReady.connect(self.watch_file_ready)
+        self.watch_thread.failed.connect(self.watch_failed)
+        self.watch_thread.start()
+
+    def watch_output_dir(self):
+        # Результаты наблюдения всегда в "Media Upscaler": подпапки наблюдатель не смотрит и свои же файлы не подхватит
+        root = self.output_folder if self.output_folder and os.path.exists(self.output_folder) else self.watch_folder
+        output_dir = Path(root) / "Media Upscaler"
+        output_dir.mkdir(exist_ok=True)
+        return output_dir
+
+    def watch_file_ready(self, file_path, width, height, file_type):
+        if any(job.watched and job.input_path == file_path and job.state in ("queued", "running", "cancelling")
+               for job in self.jobs):
+            return
+        job = self.add_job(file_path, width, height, file_type, self.watch_output_dir())
+        job.watched = True
+        self.show_job_list()
+        self.schedule_jobs()
 
-        output_path = str(candidate)
+    def watch_failed(self, error_msg):
+        self.status_label.setText(error_msg)
+        self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
 
-        if file_ext in ['.jpg', '.jpeg', '.png']:
-            file_type = 'image'
-        elif file_ext == '.gif':
-            file_type = 'gif'
-        else:
-            file_type = 'video'
+    def mark_watched(self, job):
+        if job.watched and self.watch_thread is not None:
+            self.watch_thread.watcher.mark_done(job.input_path)
 
-        self.progress_bar.setValue(0)
-        self.progress_bar.setVisible(True)
-        self.process_btn.setEnabled(False)
-        self.select_btn.setEnabled(False)
-        self.status_label.setText("Обработка...")
-        self.status_label.setStyleSheet("color: #f0883e; font-weight: bold;")
+    def closeEvent(self, event):
+        if self.watch_thread is not None:
+            self.watch_thread.requestInterruption()
+            self.watch_thread.wait()
+        super().closeEvent(event)
 
-        self.thread = UpscaleThread(self.current_file, output_path, width, height, file_type)
-        self.thread.progress.connect(self.update_progress)
-        self.thread.finished.connect(self.process_finished)
-        self.thread.error.connect(self.process_error)
-        self.thread.start()
+    def schedule_jobs(self):
+        queued = sorted(
+            (job for job in self.jobs if job.state == "queued"),
+            key=lambda job: (JOB_PRIORITY.get(job.file_type, len(JOB_PRIORITY)), job.order)
+        )
+        # Лимит общий для всех задач; картинки и GIF стоят в очереди первыми и занимают освободившийся слот раньше видео
+        for job in queued:
+            running = [other for other in self.jobs if other.state in ("running", "cancelling")]
+            if len(running) >= self.max_jobs:
+                break
+            self.start_job(job)
+        self.update_queue_status()
+
+    def start_job(self, job):
+        from upscaler import ResultCache
+        job.state = "running"
+        job.widget.set_state("running")
+        job.thread = UpscaleThread(
+            job.input_path, job.output_path, job.width, job.height, job.file_type,
+            parallel=self.video_parallel, codec=self.video_codec, preset=self.video_preset,
+            resumable=self.video_resumable, dedupe=self.video_dedupe,
+            fast_downscale=self.fast_downscale, image_profile=self.image_profile,
+            cache=ResultCache(limit=self.cache_limit_gb * 2**30) if self.cache_enabled else None,
+            start_time=job.start_time, end_time=job.end_time, ladder=job.ladder,
+            trace_path=f"{job.output_path}.trace.json" if self.profile_trace else None
+        )
+        job.thread.finished.connect(lambda output_path, job=job: self.job_finished(job, output_path))
+        job.thread.error.connect(lambda error_msg, job=job: self.job_failed(job, error_msg))
+        job.thread.cancelled.connect(lambda job=job: self.job_cancelled(job))
+        job.thread.start()
+        self.telemetry_timer.start(TELEMETRY_POLL_MS)
+
+    def cancel_job(self, job):
+        if job.state == "queued":
+            job.state = "cancelled"
+            job.widget.set_state("cancelled")
+            self.update_queue_status()
+        elif job.state == "running":
+            job.state = "cancelling"
+            job.widget.set_state("cancelling")
+            job.thread.upscaler.cancel()
+
+    def retry_job(self, job):
+        from upscaler import next_output_path
+        if job.state not in ("error", "cancelled"):
+            return
+        if os.path.exists(job.output_path):
+            taken = [other.output_path for other in self.jobs if other is not job]
+            job.output_path = next_output_path(
+                job.input_path, Path(job.output_path).parent, taken, Path(job.output_path).suffix
+            )
+        job.state = "queued"
+        job.widget.set_state("queued")
+        self.schedule_jobs()
+
+    def clear_finished_jobs(self):
+        for job in [job for job in self.jobs if job.state in ("done", "error", "cancelled")]:
+            self.jobs.remove(job)
+            job.widget.deleteLater()
+        if not self.jobs:
+            self.job_list.setVisible(False)
+            self.upscaler_stretch.setVisible(True)
+        self.update_queue_status()
+
+    def update_queue_status(self):
+        counts = {}
+        for job in self.jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        self.clear_jobs_btn.setVisible(any(
+            counts.get(state) for state in ("done", "error", "cancelled")
+        ))
+        if not self.jobs:
+            self.status_label.setText("")
+            return
 
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
+        parts = [f"Выполняется: {counts.get('running', 0) + counts.get('cancelling', 0)}"]
+        parts.append(f"В очереди: {counts.get('queued', 0)}")
+        parts.append(f"Готово: {counts.get('done', 0)}")
+        if counts.get("error"):
+            parts.append(f"Ошибок: {counts['error']}")
+        self.status_label.setText(" | ".join(parts))
+        color = "#f0883e" if counts.get("running") or counts.get("queued") else "#3fb950"
+        self.status_label.setStyleSheet(f"color: {color}; font-weight: bold;")
+
+    def poll_telemetry(self):
+        upscaling = [job for job in self.jobs if job.state in ("running", "cancelling")]
+        downloading = hasattr(self, 'download_thread') and self.download_thread.isRunning()
+
+        for job in upscaling:
+            self.update_progress(job, job.thread.telemetry.snapshot())
+        if downloading:
+            self.update_download_progress(self.download_thread.telemetry.snapshot())
+        if not upscaling and not downloading:
+            self.telemetry_timer.stop()
+
+    def update_progress(self, job, data):
+        job.widget.progress_bar.setValue(int(data['percent']))
+
+        if job.file_type == 'image' or job.state != "running":
+            return
 
-    def process_finished(self, output_path):
-        self.progress_bar.setVisible(False)
-        self.process_btn.setEnabled(True)
-        self.select_btn.setEnabled(True)
-        self.status_label.setText(f"Готово! {Path(output_path).name}")
-        self.status_label.setStyleSheet("color: #3fb950; font-weight: bold;")
+        done = data['done']
+        total = data['total']
+        rate_text = f"{data['rate']:.1f} кадр/с" if data['rate'] > 0 else "-- кадр/с"
+        count_text = f"{done} / {total} кадров" if total > 0 else f"{done} кадров"
+        job.widget.info_label.setText(
+            f"Скорость: {rate_text} | {count_text} | Осталось: {format_eta(data['eta'])}"
+        )
 
-    def process_error(self, error_msg):
-        self.progress_bar.setVisible(False)
-        self.process_btn.setEnabled(True)
-        self.select_btn.setEnabled(True)
-        self.status_label.setText(error_msg)
-        self.status_label.setStyleSheet("color: #f85149; font-weight: bold;")
+    def job_finished(self, job, output_path):
+        from upscaler import format_profile
+        job.state = "done"
+        text = f"Готово! {Path(output_path).name}"
+        if job.ladder:
+            text += f" и ещё {len(job.ladder)}: " + ", ".join(Path(path).name for _, _, path in job.ladder)
+        if job.thread.stats.get("cache") == "hit":
+            text += " | из кэша"
+        duplicates = job.thread.stats.get("duplicate_frames")
+        if duplicates and duplicates["skipped"]:
+            text += f" | повторяющихся кадров: {duplicates['skipped']} из {duplicates['checked']} - ресайз пропущен"
+        profile = job.thread.stats.get("profile")
+        if profile:
+            text += f"\nЭтапы: {format_profile(profile, limit=3)}"
+        job.widget.set_state("done", text)
+        self.mark_watched(job)
+        self.schedule_jobs()
+
+    def job_failed(self, job, error_msg):
+        job.state = "error"
+        job.widget.set_state("error", error_msg)
+        self.mark_watched(job)
+        self.schedule_jobs()
+
+    def job_cancelled(self, job):
+        job.state = "cancelled"
+        job.widget.set_state("cancelled")
+        self.schedule_jobs()
 
     def download_video(self):
         url = self.url_input.text().strip()
@@ -1360,18 +2062,17 @@ class MediaUpscaler(QMainWindow):
         self.download_info.setText("")
 
         self.download_thread = DownloadThread(url, output_template, quality, audio_mode, audio_format)
-        self.download_thread.progress.connect(self.update_download_progress)
         self.download_thread.finished.connect(self.download_finished)
         self.download_thread.error.connect(self.download_error)
         self.download_thread.start()
+        self.telemetry_timer.start(TELEMETRY_POLL_MS)
 
     def update_download_progress(self, data):
-        percent = data.get('percent', 0)
-        speed = data.get('speed', 0)
-        total = data.get('total', 0)
-        downloaded = data.get('downloaded', 0)
+        speed = data['rate']
+        total = data['total']
+        downloaded = data['done']
 
-        self.download_progress.setValue(percent)
+        self.download_progress.setValue(int(data['percent']))
 
         if speed and speed > 0:
             speed_mb = speed / (1024 * 1024)
@@ -1386,7 +2087,9 @@ class MediaUpscaler(QMainWindow):
         else:
             size_text = "Размер неизвестен"
 
-        self.download_info.setText(f"Скорость: {speed_text} | {size_text}")
+        self.download_info.setText(
+            f"Скорость: {speed_text} | {size_text} | Осталось: {format_eta(data['eta'])}"
+        )
 
     def download_finished(self, output_path):
         self.download_progress.setVisible(False)
@@ -1416,22 +2119,46 @@ class MediaUpscaler(QMainWindow):
 
 
 if __name__ == '__main__':
+    # --startup-report печатает время запуска, --quit-after-startup закрывает окно сразу после замера
+    startup = StartupReport(STARTUP_STARTED)
+    startup.mark("imports")
+
     app = QApplication(sys.argv)
-    app.setStyle('Fusion') 
+    app.setStyle('Fusion')
+    startup.mark("qapplication")
 
     loading = LoadingScreen()
     loading.show()
-    app.processEvents() 
+    app.processEvents()
+    startup.mark("loading_screen")
+
+    threading.Thread(target=warm_up_modules, args=(startup,), daemon=True).start()
 
     window = MediaUpscaler()
-    window.load_profile_avatar() 
+    window.load_profile_avatar()
+    startup.mark("window_built")
+
+    window.show()
+    window.raise_()
+    window.activateWindow()
+    loading.close()
+    startup.mark("window_shown")
+    # Первый проход цикла событий после show - окно отрисовано и принимает ввод
+    QTimer.singleShot(0, lambda: startup.mark("interactive"))
+
+    if "--startup-report" in sys.argv or "--quit-after-startup" in sys.argv:
+        def check_startup():
+            if not startup.is_complete():
+                return
+            startup_timer.stop()
+            if "--startup-report" in sys.argv:
+                print(startup.format())
+                print(json.dumps(startup.as_dict(), ensure_ascii=False), flush=True)
+            if "--quit-after-startup" in sys.argv:
+                app.quit()
 
-    def show_main():
-        window.show()
-        window.raise_()
-        window.activateWindow()
-        loading.close()
+        startup_timer = QTimer()
+        startup_timer.timeout.connect(check_startup)
+        startup_timer.start(20)
 
-    QTimer.singleShot(1500, show_main) 
-    
     sys.exit(app.exec())
\ No newline at end of file
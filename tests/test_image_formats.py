@@ -0,0 +1,44 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upscaler import Upscaler, image_format_available, use_probe_cache  # noqa: E402
+
+
+class WideModeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        use_probe_cache(None)
+        cls.work_dir = tempfile.mkdtemp(prefix="media_test_")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def test_16bit_to_8bit_formats(self):
+        # 16-битный градиент в JPEG/WebP должен остаться градиентом, а не стать белым
+        data = np.linspace(0, 65535, 256 * 192).reshape(192, 256).astype(np.uint16)
+        source = os.path.join(self.work_dir, "gray16.png")
+        Image.fromarray(data).save(source)
+        self.assertEqual(Image.open(source).mode, "I;16")
+
+        for suffix, pil_format in ((".jpg", "JPEG"), (".webp", "WEBP")):
+            if not image_format_available(pil_format):
+                continue
+            with self.subTest(format=pil_format):
+                output = os.path.join(self.work_dir, f"out{suffix}")
+                Upscaler(source, output, 512, 384, "image").run()
+                result = np.asarray(Image.open(output).convert("L"), dtype=np.float64)
+                self.assertAlmostEqual(result.mean(), data.mean() / 257, delta=2.0)
+                self.assertLess((result >= 254).mean(), 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
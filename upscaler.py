@@ -0,0 +1,2953 @@
+import sys
+import os
+import subprocess
+import threading
+import time
+import tempfile
+import shutil
+import queue
+import multiprocessing
+import argparse
+import glob
+import importlib
+import copy
+import math
+import struct
+import re
+import select
+import ctypes
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from PIL import Image, ImageFile, GifImagePlugin, PngImagePlugin
+import cv2
+import numpy as np
+import json
+import zlib
+import hashlib
+import atexit
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+GIF_EXTENSIONS = ('.gif',)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.wmv', '.flv')
+MEDIA_EXTENSIONS = IMAGE_EXTENSIONS + GIF_EXTENSIONS + VIDEO_EXTENSIONS
+
+
+class UpscaleError(Exception):
+    pass
+
+
+class UpscaleCancelled(UpscaleError):
+    pass
+
+
+class Telemetry:
+    # Рабочий поток только обновляет счётчики, а интерфейс сам опрашивает их по таймеру.
+    # Так в очередь событий Qt не летят тысячи сигналов в секунду
+    def __init__(self, window=3.0):
+        self.lock = threading.Lock()
+        self.window = window
+        self.total = 0
+        self.done = 0
+        self.started = time.monotonic()
+        self.samples = deque()
+        self.stages = False
+
+    def start(self, total=0, stages=False):
+        # stages - шаги обработки одной картинки, а не кадры: для процента они есть, а кадр один
+        with self.lock:
+            self.total = total
+            self.stages = stages
+            self.done = 0
+            self.started = time.monotonic()
+            self.samples.clear()
+
+    def update(self, done, total=None):
+        with self.lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+
+    def add(self, count=1):
+        with self.lock:
+            self.done += count
+
+    def finish(self):
+        with self.lock:
+            if self.total > 0:
+                self.done = self.total
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            done = self.done
+            total = self.total
+            # Счётчик пошёл заново (например, yt-dlp перешёл к аудиодорожке) - старая история не нужна
+            if self.samples and done < self.samples[-1][1]:
+                self.samples.clear()
+            self.samples.append((now, done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+            first_time, first_done = self.samples[0]
+            started = self.started
+            frames = int(total > 0 and done >= total) if self.stages else done
+
+        rate = (done - first_done) / (now - first_time) if now > first_time else 0.0
+        return {
+            "done": done,
+            "total": total,
+            "frames": frames,
+            "percent": min(100.0, done / total * 100) if total > 0 else 0.0,
+            "rate": rate,
+            "eta": (total - done) / rate if rate > 0 and total > done else None,
+            "elapsed": now - started,
+        }
+
+
+PROFILE_BUCKETS_PER_DOUBLING = 16
+TRACE_MAX_EVENTS = 500_000
+
+
+class StageProfiler:
+    # Замеры этапов складываются в логарифмическую гистограмму (шаг ~4%): память не растёт
+    # с длиной видео, а запись - пара вызовов perf_counter на кадр, поэтому профилировщик включён всегда.
+    # Поштучные события для trace-файла копятся, только если он запрошен
+    def __init__(self, trace=False, origin=None):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter() if origin is None else origin
+        self.stages = {}
+        self.events = [] if trace else None
+        self.dropped_events = 0
+
+    def record(self, name, started, ended):
+        duration = ended - started
+        bucket = int(math.log2(max(duration, 1e-7) * 1e7) * PROFILE_BUCKETS_PER_DOUBLING)
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"count": 0, "total": 0.0, "max": 0.0, "buckets": {}}
+            stage["count"] += 1
+            stage["total"] += duration
+            stage["max"] = max(stage["max"], duration)
+            stage["buckets"][bucket] = stage["buckets"].get(bucket, 0) + 1
+            if self.events is not None:
+                if len(self.events) < TRACE_MAX_EVENTS:
+                    self.events.append((name, os.getpid(), threading.get_ident(), started, duration))
+                else:
+                    self.dropped_events += 1
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter())
+
+    def export(self):
+        with self.lock:
+            return {
+                "stages": {
+                    name: dict(stage, buckets=dict(stage["buckets"]))
+                    for name, stage in self.stages.items()
+                },
+                "events": list(self.events) if self.events is not None else None,
+                "dropped_events": self.dropped_events,
+            }
+
+    def merge(self, data):
+        # Замеры из дочерних процессов (сегменты): perf_counter монотонный на всю систему,
+        # поэтому их события ложатся на ту же шкалу времени
+        with self.lock:
+            for name, other in data["stages"].items():
+                stage = self.stages.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "buckets": {}})
+                stage["count"] += other["count"]
+                stage["total"] += other["total"]
+                stage["max"] = max(stage["max"], other["max"])
+                for bucket, count in other["buckets"].items():
+                    stage["buckets"][bucket] = stage["buckets"].get(bucket, 0) + count
+            if self.events is not None and data["events"]:
+                room = TRACE_MAX_EVENTS - len(self.events)
+                self.events.extend(data["events"][:room])
+                self.dropped_events += max(0, len(data["events"]) - room)
+            self.dropped_events += data["dropped_events"]
+
+    def summary(self):
+        def percentile(buckets, count, fraction):
+            target = max(1, math.ceil(count * fraction))
+            seen = 0
+            for bucket in sorted(buckets):
+                seen += buckets[bucket]
+                if seen >= target:
+                    # Середина корзины в секундах
+                    return 2 ** ((bucket + 0.5) / PROFILE_BUCKETS_PER_DOUBLING) / 1e7
+            return 0.0
+
+        with self.lock:
+            summary = {}
+            for name, stage in self.stages.items():
+                count = stage["count"]
+                summary[name] = {
+                    "count": count,
+                    "total": round(stage["total"], 4),
+                    "mean_ms": round(stage["total"] / count * 1000, 3),
+                    "p50_ms": round(min(percentile(stage["buckets"], count, 0.50), stage["max"]) * 1000, 3),
+                    "p99_ms": round(min(percentile(stage["buckets"], count, 0.99), stage["max"]) * 1000, 3),
+                    "max_ms": round(stage["max"] * 1000, 3),
+                }
+            return summary
+
+    def write_trace(self, path):
+        # Формат trace-event: открывается в chrome://tracing и Perfetto
+        with self.lock:
+            events = [
+                {
+                    "name": name,
+                    "cat": "upscale",
+                    "ph": "X",
+                    "ts": round((started - self.origin) * 1e6, 1),
+                    "dur": round(duration * 1e6, 1),
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, pid, tid, started, duration in (self.events or [])
+            ]
+            metadata = {"dropped_events": self.dropped_events}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": metadata}, f)
+
+
+def format_profile(summary, limit=None):
+    stages = sorted(summary.items(), key=lambda item: item[1]["total"], reverse=True)[:limit]
+    return " | ".join(
+        f"{name} {stage['total']:.1f} с (p50 {stage['p50_ms']:.1f} / p99 {stage['p99_ms']:.1f} мс)"
+        for name, stage in stages
+    )
+
+
+def run_ffmpeg(cmd):
+    return subprocess.run(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+
+
+PIPELINE_QUEUE_SIZE = 8
+
+
+def run_frame_pipeline(read_frame, process_frame, write_frame, queue_size=PIPELINE_QUEUE_SIZE, profiler=None):
+    # Декодирование, ресайз и запись идут в трёх потоках одновременно:
+    # OpenCV отпускает GIL внутри read/resize/write, а ограниченные очереди держат память в узде
+    decoded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def decode_stage():
+        try:
+            while True:
+                started = time.perf_counter()
+                frame = read_frame()
+                if profiler is not None and frame is not None:
+                    profiler.record("decode", started, time.perf_counter())
+                if frame is None or not put(decoded, frame):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(decoded, None)
+
+    def resize_stage():
+        try:
+            while True:
+                frame = get(decoded)
+                if frame is None:
+                    break
+                started = time.perf_counter()
+                frame = process_frame(frame)
+                if profiler is not None:
+                    profiler.record("resize", started, time.perf_counter())
+                if not put(processed, frame):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(processed, None)
+
+    threads = [
+        threading.Thread(target=decode_stage, daemon=True),
+        threading.Thread(target=resize_stage, daemon=True)
+    ]
+    for t in threads:
+        t.start()
+
+    frame_count = 0
+    try:
+        while True:
+            frame = get(processed)
+            if frame is None:
+                break
+            started = time.perf_counter()
+            write_frame(frame)
+            if profiler is not None:
+                profiler.record("encode", started, time.perf_counter())
+            frame_count += 1
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+    return frame_count
+
+
+VIDEO_CODECS = {
+    "H.264": "libx264",
+    "H.265": "libx265",
+}
+VIDEO_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+# WebM принимает только VP8/VP9/AV1 и Opus/Vorbis: для него кодеки выбираются по контейнеру, а не по настройке
+CONTAINER_CODECS = {
+    ".webm": ("libvpx-vp9", "libopus"),
+}
+VP9_SPEEDS = {"ultrafast": 5, "superfast": 5, "veryfast": 4, "faster": 4, "fast": 3, "medium": 2, "slow": 1,
+              "slower": 1, "veryslow": 0}
+
+
+# Профили кодирования картинок: "quality" - прежнее поведение (PNG с быстрым zlib, JPEG 100 без
+# прореживания цвета), остальные меняют качество на скорость или размер файла
+IMAGE_PROFILES = {
+    "quality": {
+        "PNG": dict(compress_level=1),
+        "JPEG": dict(quality=100, subsampling=0),
+        "WEBP": dict(quality=95, method=4),
+        "AVIF": dict(quality=90, speed=8),
+    },
+    "fast": {
+        "PNG": dict(compress_level=1, compress_type=zlib.Z_RLE),
+        "JPEG": dict(quality=90, subsampling=2),
+        "WEBP": dict(quality=85, method=0),
+        "AVIF": dict(quality=75, speed=10),
+    },
+    "balanced": {
+        "PNG": dict(compress_level=6),
+        "JPEG": dict(quality=92, subsampling=0, optimize=True),
+        "WEBP": dict(quality=85, method=4),
+        "AVIF": dict(quality=70, speed=8),
+    },
+    "smallest": {
+        "PNG": dict(compress_level=9, optimize=True),
+        "JPEG": dict(quality=85, subsampling=2, optimize=True, progressive=True),
+        "WEBP": dict(quality=80, method=6),
+        "AVIF": dict(quality=60, speed=6),
+    },
+}
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp", "avif": ".avif"}
+PIL_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".avif": "AVIF"}
+# Режимы, которые формат умеет сохранять; всё остальное приводится к RGB или RGBA
+FORMAT_MODES = {"JPEG": ("L", "RGB", "CMYK"), "WEBP": ("RGB", "RGBA"), "AVIF": ("RGB", "RGBA")}
+
+
+def image_format_available(pil_format):
+    if pil_format == "AVIF":
+        try:
+            # До Pillow 11.2 AVIF умеет только отдельный плагин
+            importlib.import_module("pillow_avif")
+        except ImportError:
+            pass
+    Image.init()
+    return pil_format in Image.SAVE
+
+
+def output_suffix(input_path, image_format=None):
+    if image_format and detect_file_type(input_path) == 'image':
+        return IMAGE_FORMATS[image_format]
+    return Path(input_path).suffix.lower()
+
+
+def encoder_options(path, profile="quality"):
+    pil_format = PIL_FORMATS.get(Path(path).suffix.lower())
+    if pil_format is None:
+        raise UpscaleError(f"Неподдерживаемый формат результата: {Path(path).suffix}")
+    if not image_format_available(pil_format):
+        raise UpscaleError(f"Сохранение в {pil_format} не поддерживается этой сборкой Pillow")
+    return pil_format, IMAGE_PROFILES[profile][pil_format]
+
+
+def to_8bit(img):
+    # convert() у 16-битных и float-картинок не масштабирует, а обрезает значения до 255 - почти всё белое.
+    # Диапазон сжимается заранее: 16 бит делятся на 257, float в 0..1 умножается на 255
+    data = np.asarray(img, dtype=np.float32)
+    scale = 255.0 if img.mode == "F" and data.max() <= 1.0 else 1 / 257
+    return Image.fromarray(np.clip(data * scale + 0.5, 0, 255).astype(np.uint8), "L")
+
+
+def convert_for_format(img, pil_format):
+    modes = FORMAT_MODES.get(pil_format)
+    if modes is None or img.mode in modes:
+        return img
+    if img.mode.startswith(("I", "F")):
+        img = to_8bit(img)
+        if img.mode in modes:
+            return img
+    has_alpha = img.mode in ("RGBA", "LA", "La", "PA", "RGBa") or "transparency" in img.info
+    return img.convert("RGBA" if has_alpha and "RGBA" in modes else "RGB")
+
+
+_maxblock_lock = threading.Lock()
+
+
+def save_image(img, path, pil_format, **options):
+    try:
+        img.save(path, pil_format, **options)
+    except OSError:
+        # JPEG с optimize/progressive собирается целиком в буфере размером примерно в байт на пиксель,
+        # шумные картинки без прореживания цвета в него не влезают. Случай редкий - повторяем с буфером под худший
+        if pil_format != "JPEG" or not (options.get("optimize") or options.get("progressive")):
+            raise
+        with _maxblock_lock:
+            maxblock = ImageFile.MAXBLOCK
+            ImageFile.MAXBLOCK = max(maxblock, 2 * img.width * img.height * len(img.getbands()))
+            try:
+                img.save(path, pil_format, **options)
+            finally:
+                ImageFile.MAXBLOCK = maxblock
+
+
+TILED_RESIZE_MIN_PIXELS = 8_000_000
+
+
+def split_range(size, parts):
+    bounds = [size * i // parts for i in range(parts + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+class TiledResizer:
+    # Ресайз очень больших изображений по частям в пуле потоков: Image.resize однопоточный.
+    # Результат бит-в-бит совпадает с одиночным вызовом resize. Кадрам видео это не нужно -
+    # cv2.resize и так делит кадр по строкам между ядрами
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def resize_image(self, img, size, resample=Image.Resampling.LANCZOS):
+        premultiplied = {"RGBA": "RGBa", "LA": "La"}
+        if img.mode not in ("L", "RGB", "RGBA", "LA") or img.size == size:
+            return img.resize(size, resample)
+
+        img.load()
+        work = img.convert(premultiplied[img.mode]) if img.mode in premultiplied else img
+        src_width, src_height = work.size
+        width, height = size
+
+        # Pillow ресайзит в два прохода: сначала по горизонтали, потом по вертикали.
+        # Горизонтальный проход режем на полосы по строкам, вертикальный - по столбцам:
+        # координаты фильтра при этом те же, что и у целого изображения
+        if width != src_width:
+            def horizontal(bounds):
+                top, bottom = bounds
+                return top, work.crop((0, top, src_width, bottom)).resize((width, bottom - top), resample)
+
+            temp = Image.new(work.mode, (width, src_height))
+            for top, part in self.pool.map(horizontal, split_range(src_height, self.workers)):
+                temp.paste(part, (0, top))
+        else:
+            temp = work
+
+        if height != src_height:
+            def vertical(bounds):
+                left, right = bounds
+                return left, temp.crop((left, 0, right, src_height)).resize((right - left, height), resample)
+
+            result = Image.new(work.mode, size)
+            for left, part in self.pool.map(vertical, split_range(width, self.workers)):
+                result.paste(part, (left, 0))
+        else:
+            result = temp
+
+        return result.convert(img.mode) if img.mode in premultiplied else result
+
+
+_tiled_resizer = None
+
+
+def get_tiled_resizer():
+    global _tiled_resizer
+    if _tiled_resizer is None:
+        _tiled_resizer = TiledResizer()
+    return _tiled_resizer
+
+
+def needs_tiled_resize(src_size, dst_size):
+    return max(src_size[0] * src_size[1], dst_size[0] * dst_size[1]) >= TILED_RESIZE_MIN_PIXELS
+
+
+# Быстрое уменьшение в несколько шагов: грубые шаги (draft JPEG, reduce, pyrDown) останавливаются,
+# когда до цели остаётся не меньше DOWNSCALE_GAP раз, дальше работает точный фильтр.
+# На фотографиях и кадрах SSIM с результатом одного точного прохода не ниже DOWNSCALE_SSIM_MIN
+DOWNSCALE_GAP = 2.0
+DOWNSCALE_SSIM_MIN = 0.99
+
+
+def downscale_factor(src_size, dst_size):
+    return int(min(src_size[0] / dst_size[0], src_size[1] / dst_size[1]) / DOWNSCALE_GAP)
+
+
+def draft_image(img, size):
+    # JPEG умеет декодироваться сразу в 1/2, 1/4 или 1/8 масштаба прямо в DCT - лишние пиксели
+    # даже не распаковываются. Pillow берёт самый мелкий масштаб, который не меньше запрошенного
+    if img.format == "JPEG" and downscale_factor(img.size, size) >= 2:
+        img.draft(img.mode, (round(size[0] * DOWNSCALE_GAP), round(size[1] * DOWNSCALE_GAP)))
+    return img
+
+
+def pyramid_levels(src_size, dst_size):
+    # У INTER_AREA быстрая ветка только для целых коэффициентов, при дробных большое уменьшение
+    # заметно дешевле начать с pyrDown (вдвое за шаг)
+    factor = downscale_factor(src_size, dst_size)
+    if factor < 2 or (src_size[0] % dst_size[0] == 0 and src_size[1] % dst_size[1] == 0):
+        return 0
+    return int(math.log2(factor))
+
+
+def pyramid_resize(frame, size, levels, dst=None):
+    for _ in range(levels):
+        frame = cv2.pyrDown(frame)
+    return cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+
+STRIP_RESIZE_MIN_PIXELS = 50_000_000
+STRIP_MEMORY_BUDGET = 32 * 2**20
+STRIP_MIN_HEIGHT = 16
+# Радиус фильтра LANCZOS в пикселях исходника (при уменьшении растёт вместе с масштабом)
+STRIP_FILTER_SUPPORT = 3
+# Режимы, которые Pillow умеет раскладывать прямо по внешнему буферу: байт на пиксель
+MAPPED_MODES = {"L": 1, "P": 1, "RGB": 4, "RGBA": 4, "CMYK": 4}
+PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "RGBA": 6}
+
+LARGE_IMAGE_PIXELS = 1_000_000_000
+_pixels_lock = threading.Lock()
+
+
+def open_image(path):
+    # По умолчанию Pillow не открывает картинки больше ~179 Мп (защита от "бомб"). Огромные сканы
+    # обрабатываются полосами в ограниченной памяти, поэтому порог выше - но только на время открытия
+    # своих файлов, остальной процесс живёт с защитой Pillow
+    with _pixels_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = LARGE_IMAGE_PIXELS
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def needs_strip_resize(src_size, dst_size):
+    return max(src_size[0] * src_size[1], dst_size[0] * dst_size[1]) >= STRIP_RESIZE_MIN_PIXELS
+
+
+def strip_work_mode(img):
+    # Полосы работают с 8 битами на канал; 16-битные и float-картинки (I;16, I, F) идут обычным путём,
+    # иначе приведение к RGB обрезает их в белое
+    if img.mode.startswith(("I", "F")):
+        return None
+    if img.mode in PNG_COLOR_TYPES:
+        return img.mode
+    if img.mode == "1":
+        return "L"
+    if img.mode in ("LA", "La", "PA", "RGBa") or "transparency" in img.info:
+        return "RGBA"
+    return "RGB"
+
+
+def split_strips(src_size, dst_size):
+    # Полоса результата плюс соответствующий ей кусок исходника укладываются в STRIP_MEMORY_BUDGET
+    scale = src_size[1] / dst_size[1]
+    row_bytes = 4 * (dst_size[0] + src_size[0] * scale)
+    height = max(STRIP_MIN_HEIGHT, int(STRIP_MEMORY_BUDGET // row_bytes))
+    return [(top, min(top + height, dst_size[1])) for top in range(0, dst_size[1], height)]
+
+
+def map_image(img, path):
+    # Декодирует картинку прямо в файл, отображённый в память: в куче процесса исходник не лежит,
+    # а страницы уже пройденных полос ядро может сбросить на диск
+    channels = MAPPED_MODES.get(img.mode)
+    if channels is None:
+        img.load()
+        return img
+    buffer = np.memmap(path, dtype=np.uint8, mode="w+", shape=(img.height, img.width * channels))
+    img.im = Image.core.map_buffer(buffer, img.size, "raw", 0, (img.mode, 0, 1))
+    img.load()
+    return img
+
+
+def resize_strip(img, size, bounds, mode, resample=Image.Resampling.LANCZOS):
+    # Из исходника берутся только строки под полосу плюс запас на радиус фильтра, а box
+    # задаёт те же дробные координаты выборки, что и при ресайзе всей картинки целиком
+    src_width, src_height = img.size
+    top, bottom = bounds
+    if img.size == size:
+        slab = img.crop((0, top, src_width, bottom))
+        return slab if slab.mode == mode else slab.convert(mode)
+
+    scale = src_height / size[1]
+    margin = math.ceil(STRIP_FILTER_SUPPORT * max(scale, 1.0)) + 1
+    box_top, box_bottom = top * scale, bottom * scale
+    crop_top = max(0, int(box_top) - margin)
+    crop_bottom = min(src_height, math.ceil(box_bottom) + margin)
+
+    slab = img.crop((0, crop_top, src_width, crop_bottom))
+    if slab.mode != mode:
+        slab = slab.convert(mode)
+    return slab.resize(
+        (size[0], bottom - top), resample,
+        box=(0, box_top - crop_top, src_width, box_bottom - crop_top)
+    )
+
+
+PNG_FILTER_ROWS = 64
+
+
+def png_paeth_filter(rows, above, channels):
+    # Фильтр Paeth из PNG. На фотографиях и градиентах сжимается не хуже адаптивного выбора
+    # фильтра в Pillow, а считается одним проходом numpy; строки идут кусками, чтобы не раздувать память
+    filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 4
+    for start in range(0, rows.shape[0], PNG_FILTER_ROWS):
+        chunk = rows[start:start + PNG_FILTER_ROWS]
+        upper = np.concatenate((above, chunk[:-1]))
+        left = np.zeros_like(chunk)
+        left[:, channels:] = chunk[:, :-channels]
+        upper_left = np.zeros_like(chunk)
+        upper_left[:, channels:] = upper[:, :-channels]
+
+        a, b, c = left.astype(np.int16), upper.astype(np.int16), upper_left.astype(np.int16)
+        pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+        predictor = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, upper, upper_left))
+        np.subtract(chunk, predictor, out=filtered[start:start + len(chunk), 1:])
+        above = chunk[-1:]
+    return filtered
+
+
+class PngStripWriter:
+    # PNG пишется по полосам: строки фильтруются и сразу уходят в zlib,
+    # так что целиком картинка не нужна ни в памяти, ни на диске
+    def __init__(self, path, size, mode, icc_profile=None, compress_level=1, compress_type=zlib.Z_DEFAULT_STRATEGY,
+                 optimize=False):
+        self.file = open(path, 'wb')
+        self.channels = len(mode)
+        self.previous = np.zeros((1, size[0] * self.channels), dtype=np.uint8)
+        if optimize:
+            compress_level = 9
+        self.compressor = zlib.compressobj(compress_level, zlib.DEFLATED, zlib.MAX_WBITS, 9, compress_type)
+        self.file.write(PngImagePlugin._MAGIC)
+        header = struct.pack(">IIBBBBB", size[0], size[1], 8, PNG_COLOR_TYPES[mode], 0, 0, 0)
+        PngImagePlugin.putchunk(self.file, b"IHDR", header)
+        if icc_profile:
+            PngImagePlugin.putchunk(self.file, b"iCCP", b"ICC Profile\0\0" + zlib.compress(icc_profile))
+
+    def prepare(self, strip):
+        # Фильтр считается в пуле вместе с ресайзом. Первая строка зависит от последней строки
+        # предыдущей полосы, поэтому её фильтр пересчитывается уже при записи
+        rows = np.asarray(strip).reshape(strip.height, -1)
+        return rows, png_paeth_filter(rows, np.zeros_like(self.previous), self.channels)
+
+    def write(self, top, prepared):
+        rows, filtered = prepared
+        filtered[:1] = png_paeth_filter(rows[:1], self.previous, self.channels)
+        self.previous = rows[-1:]
+        self.put(self.compressor.compress(filtered))
+
+    def put(self, data):
+        if data:
+            PngImagePlugin.putchunk(self.file, b"IDAT", data)
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self.put(self.compressor.flush())
+            PngImagePlugin.putchunk(self.file, b"IEND", b"")
+        finally:
+            self.file.close()
+
+
+class MappedStripWriter:
+    # Для форматов без построчной записи (JPEG) результат собирается в файле, отображённом в память,
+    # и кодируется Pillow уже оттуда
+    def __init__(self, path, size, mode, buffer_path, pil_format, **save_options):
+        self.path = path
+        self.pil_format = pil_format
+        self.size = size
+        self.mode = mode
+        self.save_options = save_options
+        self.buffer = np.memmap(buffer_path, dtype=np.uint8, mode="w+", shape=(size[1], size[0] * MAPPED_MODES[mode]))
+        self.closed = False
+
+    def prepare(self, strip):
+        return strip
+
+    def write(self, top, strip):
+        rows = np.asarray(strip).reshape(strip.height, strip.width, -1)
+        target = self.buffer[top:top + strip.height].reshape(strip.height, strip.width, -1)
+        target[..., :rows.shape[2]] = rows
+        if target.shape[2] > rows.shape[2]:
+            target[..., rows.shape[2]:] = 255
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        image = Image.new(self.mode, (0, 0))._new(
+            Image.core.map_buffer(self.buffer, self.size, "raw", 0, (self.mode, 0, 1))
+        )
+        save_image(image, self.path, self.pil_format, **self.save_options)
+
+
+def parse_rate(value):
+    num, _, den = (value or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+PROBE_CACHE_LIMIT = 5000
+# Меняется вместе с содержимым сведений: записи старых версий (например, без учёта поворота) пересчитываются
+PROBE_CACHE_VERSION = 2
+PROBE_SAVE_INTERVAL = 2.0
+_probe_lock = threading.Lock()
+_probe_cache = None
+# path: свой файл кэша вместо общего (бенчмарк), None - кэш только в памяти
+_probe_saved = {"time": 0.0, "dirty": False, "path": ""}
+
+
+def probe_number(value, kind=float):
+    # ffprobe пишет "N/A" для неизвестных значений
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return kind(0)
+
+
+def run_ffprobe(args, path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", *args, "-of", "json", path],
+        capture_output=True,
+        text=True,
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout or "{}")
+    except ValueError:
+        return None
+
+
+def stream_rotation(stream):
+    # Поворот в новых ffmpeg лежит в side data (Display Matrix), в старых - в теге rotate
+    for side_data in stream.get("side_data_list") or []:
+        if "rotation" in side_data:
+            return round(probe_number(side_data["rotation"])) % 360
+    return round(probe_number((stream.get("tags") or {}).get("rotate"))) % 360
+
+
+def probe_video(path, count_frames=True):
+    if shutil.which("ffprobe"):
+        # Только заголовки контейнера: без декодирования и без чтения всего файла
+        data = run_ffprobe([
+            "-show_entries",
+            "stream=codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate,nb_frames,duration"
+            ":stream_tags=rotate:stream_side_data=rotation:format=duration",
+        ], path)
+        streams = (data or {}).get("streams") or []
+        video = next((s for s in streams if s.get("codec_type") == "video" and s.get("width")), None)
+        if video is not None:
+            audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+            fps = parse_rate(video.get("avg_frame_rate")) or parse_rate(video.get("r_frame_rate"))
+            fps = fps if fps > 0 else 60.0
+            duration = probe_number(video.get("duration")) or probe_number(data.get("format", {}).get("duration"))
+            # MP4/MOV/AVI хранят число кадров в заголовке; MKV и WebM - нет
+            frame_count = probe_number(video.get("nb_frames"), int)
+            exact = frame_count > 0
+            if not exact and count_frames:
+                # -count_packets только демультиплексирует файл, без декодирования - точно и сравнительно быстро
+                counted = run_ffprobe([
+                    "-select_streams", "v:0", "-count_packets", "-show_entries", "stream=nb_read_packets"
+                ], path)
+                counted = ((counted or {}).get("streams") or [{}])[0]
+                frame_count = probe_number(counted.get("nb_read_packets"), int)
+                exact = frame_count > 0
+            if not exact:
+                frame_count = round(duration * fps)
+            # ffprobe отдаёт размер как закодировано. Декодеры (ffmpeg, OpenCV) сами поворачивают кадр
+            # по матрице отображения, поэтому и размеры берём уже повёрнутые
+            width, height = int(video["width"]), int(video["height"])
+            if stream_rotation(video) % 180 == 90:
+                width, height = height, width
+            return {
+                "width": width,
+                "height": height,
+                "fps": fps,
+                "frame_count": frame_count,
+                "frame_count_exact": exact,
+                "duration": duration,
+                "video_codec": video.get("codec_name"),
+                "audio_codec": audio.get("codec_name") if audio else None,
+                "has_audio": audio is not None,
+            }
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    fps = fps if fps > 0 else 60.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    info = {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "frame_count": frame_count,
+        # OpenCV берёт число кадров из длительности - это оценка
+        "frame_count_exact": False,
+        "duration": frame_count / fps,
+        "video_codec": fourcc.to_bytes(4, "little").decode("ascii", "replace").strip("\0 ").lower() or None,
+        "audio_codec": None,
+        # Без ffprobe наличие звука неизвестно
+        "has_audio": None,
+    }
+    if count_frames and shutil.which("ffmpeg"):
+        info.update(count_frames_ffmpeg(path))
+    return info
+
+
+def count_frames_ffmpeg(path):
+    # Запасной путь без ffprobe: ffmpeg копирует видеопоток в framecrc - строка на каждый пакет,
+    # только демультиплексирование без декодирования; в описании входа видно аудиопоток, если он есть
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+        capture_output=True,
+        text=True,
+        errors="replace",
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+    if result.returncode != 0:
+        return {}
+    frames = sum(1 for line in result.stdout.splitlines() if line and not line.startswith("#"))
+    audio = re.search(r"Stream #0:\d+.*?: Audio: (\w+)", result.stderr)
+    info = {"has_audio": audio is not None, "audio_codec": audio.group(1) if audio else None}
+    if frames > 0:
+        info.update(frame_count=frames, frame_count_exact=True)
+    return info
+
+
+def probe_image(path, count_frames=True):
+    with open_image(path) as img:
+        # Image.open читает только заголовок; n_frames у GIF пробегает блоки кадров без декодирования
+        frame_count = getattr(img, "n_frames", 1) if count_frames else 1
+        return {
+            "width": img.width,
+            "height": img.height,
+            "fps": 0.0,
+            "frame_count": frame_count,
+            "frame_count_exact": count_frames or not getattr(img, "is_animated", False),
+            "duration": 0.0,
+            "video_codec": (img.format or "").lower() or None,
+            "audio_codec": None,
+            "has_audio": False,
+        }
+
+
+def probe_cache_path():
+    if _probe_saved["path"] != "":
+        return _probe_saved["path"]
+    return app_data_dir() / "probe.json"
+
+
+def use_probe_cache(path):
+    global _probe_cache
+    with _probe_lock:
+        _probe_saved.update(path=path, dirty=False)
+        _probe_cache = None
+
+
+def load_probe_cache():
+    global _probe_cache
+    if _probe_cache is None:
+        _probe_cache = {}
+        if probe_cache_path() is not None:
+            try:
+                with open(probe_cache_path(), 'r', encoding='utf-8') as f:
+                    _probe_cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+    return _probe_cache
+
+
+def save_probe_cache(force=False):
+    # Папка из сотен файлов не должна переписывать файл кэша на каждый файл - сохраняем не чаще раза в пару секунд
+    with _probe_lock:
+        if not _probe_saved["dirty"] or (not force and time.monotonic() - _probe_saved["time"] < PROBE_SAVE_INTERVAL):
+            return
+        if probe_cache_path() is None:
+            return
+        try:
+            probe_cache_path().parent.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(probe_cache_path(), _probe_cache)
+        except OSError:
+            pass
+        _probe_saved.update(time=time.monotonic(), dirty=False)
+
+
+atexit.register(save_probe_cache, True)
+
+
+def probe_media(path, file_type=None, count_frames=True):
+    # Размеры, fps, число кадров, длительность, кодеки и звук. Результат кэшируется в памяти и на диске
+    # по пути, размеру и mtime: повторная загрузка папки с сотнями видео не запускает ffprobe вовсе
+    file_type = file_type or detect_file_type(path)
+    stat = os.stat(path)
+    name = os.path.abspath(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    with _probe_lock:
+        cached = load_probe_cache().get(name)
+    if (cached and cached.get("version") == PROBE_CACHE_VERSION and cached["signature"] == signature
+            and (cached["counted"] or not count_frames)):
+        return dict(cached["info"], type=file_type)
+
+    if file_type in ['image', 'gif']:
+        info = probe_image(path, count_frames)
+    else:
+        info = probe_video(path, count_frames)
+        if info is None:
+            raise UpscaleError("Не удалось открыть видеофайл")
+
+    with _probe_lock:
+        cache = load_probe_cache()
+        cache.pop(name, None)
+        cache[name] = {
+            "version": PROBE_CACHE_VERSION, "signature": signature, "counted": count_frames, "info": info
+        }
+        while len(cache) > PROBE_CACHE_LIMIT:
+            del cache[next(iter(cache))]
+        _probe_saved["dirty"] = True
+    save_probe_cache()
+    return dict(info, type=file_type)
+
+
+class FramePool:
+    # Кольцо переиспользуемых буферов кадров. Очереди конвейера ограничены, поэтому число
+    # буферов «в полёте» тоже ограничено: после разгона новые массивы больше не выделяются
+    def __init__(self, shape, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.free = []
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                self.reuses += 1
+                return self.free.pop()
+            self.allocations += 1
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def release(self, buffer):
+        if buffer.shape != self.shape or buffer.dtype != self.dtype:
+            return
+        with self.lock:
+            self.free.append(buffer)
+
+    def stats(self):
+        with self.lock:
+            return {"allocations": self.allocations, "reuses": self.reuses}
+
+
+class DuplicateFrameFilter:
+    # Экранные записи и слайд-шоу содержат длинные серии одинаковых кадров. Отпечаток кадра -
+    # CRC32 всего буфера: zlib считает его без GIL, а совпадение означает тот же кадр
+    def __init__(self):
+        self.fingerprint = None
+        self.cached = None
+        self.checked = 0
+        self.skipped = 0
+
+    def lookup(self, frame, dst):
+        self.checked += 1
+        fingerprint = zlib.crc32(frame)
+        hit = fingerprint == self.fingerprint and self.cached is not None
+        self.fingerprint = fingerprint
+        if not hit:
+            return False
+        np.copyto(dst, self.cached)
+        self.skipped += 1
+        return True
+
+    def store(self, output):
+        if self.cached is None or self.cached.shape != output.shape:
+            self.cached = np.empty_like(output)
+        np.copyto(self.cached, output)
+
+    def stats(self):
+        return {"checked": self.checked, "skipped": self.skipped}
+
+
+SEEK_MARGIN_FRAMES = 0.1
+
+
+def seek_time(frame, fps):
+    # Десятая доля кадра запаса, чтобы округление времени не съело нужный кадр. Больше нельзя:
+    # со сдвигом в полкадра ffmpeg выравнивает поток по частоте кадров и дублирует первый кадр
+    return (frame - SEEK_MARGIN_FRAMES) / fps
+
+
+_ffmpeg_options = {}
+
+
+def passthrough_args():
+    # -fps_mode есть с ffmpeg 5.1, в старых сборках то же самое делает -vsync
+    if "fps_mode" not in _ffmpeg_options:
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-h", "long"],
+                capture_output=True,
+                text=True,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+            _ffmpeg_options["fps_mode"] = "-fps_mode" in result.stdout
+        except OSError:
+            _ffmpeg_options["fps_mode"] = False
+    return ["-fps_mode" if _ffmpeg_options["fps_mode"] else "-vsync", "passthrough"]
+
+
+class FFmpegReader:
+    # Декодирование в отдельном процессе ffmpeg (многопоточно). Как и cv2.VideoCapture.read,
+    # read(image) пишет кадр прямо в переданный массив через readinto, без промежуточных копий
+    def __init__(self, input_path, width, height, start_time=0.0, frames=None):
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 3
+        cmd = [
+            "ffmpeg",
+            "-v", "error",
+            "-threads", "0"
+        ]
+        if start_time > 0:
+            cmd += ["-ss", f"{start_time:.6f}"]
+        # Кадры отдаются как есть, без подгонки под номинальный fps: иначе ffmpeg дублирует или выбрасывает
+        # кадры (151 вместо 150 у FLV/MKV, дрейф звука у VFR), и -frames:v считал бы уже подогнанные кадры
+        cmd += ["-i", input_path, "-map", "0:v:0", *passthrough_args()]
+        if frames is not None:
+            cmd += ["-frames:v", str(frames)]
+        cmd += [
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-"
+        ]
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=self.frame_size,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except FileNotFoundError:
+            self.process = None
+
+    def isOpened(self):
+        return self.process is not None and self.process.stdout is not None
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+
+        if image is None or image.shape != (self.height, self.width, 3) or image.dtype != np.uint8:
+            image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+        view = memoryview(image).cast('B')
+        filled = 0
+        while filled < self.frame_size:
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+        return True, image
+
+    def release(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+        self.process = None
+
+
+def container_codec(path, codec):
+    codecs = CONTAINER_CODECS.get(Path(path).suffix.lower())
+    return codecs[0] if codecs else codec
+
+
+def audio_encoder_args(path):
+    # Для остальных контейнеров ffmpeg сам берёт подходящий звуковой кодек
+    codecs = CONTAINER_CODECS.get(Path(path).suffix.lower())
+    return ["-c:a", codecs[1]] if codecs else []
+
+
+def cv2_fourcc(path):
+    return cv2.VideoWriter_fourcc(*('VP90' if Path(path).suffix.lower() == ".webm" else 'mp4v'))
+
+
+def video_encoder_args(codec, preset, width, height, crf=18):
+    # yuv420p требует чётных сторон, для нечётных берём 4:4:4
+    pix_fmt = "yuv420p" if width % 2 == 0 and height % 2 == 0 else "yuv444p"
+    if codec == "libvpx-vp9":
+        # У VP9 нет -preset: скорость задаёт -cpu-used, качество - -crf при нулевом битрейте,
+        # шкала CRF у него другая, 18 для x264 примерно соответствует 31
+        return [
+            "-c:v", codec,
+            "-deadline", "good",
+            "-cpu-used", str(VP9_SPEEDS.get(preset, 2)),
+            "-row-mt", "1",
+            "-crf", str(crf + 13),
+            "-b:v", "0",
+            "-pix_fmt", pix_fmt
+        ]
+    return [
+        "-c:v", codec,
+        "-preset", preset,
+        "-crf", str(crf),
+        "-pix_fmt", pix_fmt
+    ]
+
+
+class FFmpegWriter:
+    # Тот же интерфейс, что у cv2.VideoWriter: кадры BGR идут в stdin ffmpeg,
+    # который сразу кодирует их и подмешивает звук из исходника
+    def __init__(self, output_path, width, height, fps, audio_path=None, codec="libx264", preset="medium", crf=18,
+                 audio_args=()):
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", f"{fps:.6f}",
+            "-i", "-"
+        ]
+        if audio_path:
+            # audio_args (-ss/-t перед -i) обрезают звук под фрагмент видео
+            cmd += [
+                *audio_args,
+                "-i", audio_path,
+                "-map", "0:v:0",
+                "-map", "1:a:0?",
+                "-shortest",
+                *audio_encoder_args(output_path)
+            ]
+        cmd += video_encoder_args(codec, preset, width, height, crf)
+        cmd.append(output_path)
+        self.returncode = None
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except FileNotFoundError:
+            self.process = None
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError):
+            raise RuntimeError("ffmpeg прервал кодирование видео")
+
+    def release(self):
+        if self.process is None or self.returncode is not None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.returncode = self.process.wait()
+
+
+CHECKPOINT_PART_SECONDS = 10
+
+
+def write_concat_list(list_path, files):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in files:
+            # concat ищет относительные пути от папки самого списка, поэтому пишем абсолютные
+            escaped = Path(path).resolve().as_posix().replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+class JobCheckpoint:
+    # Незавершённое задание хранится рядом с результатом: готовые части видео и manifest.json
+    # с диапазонами кадров. Повторный запуск того же задания продолжает с последней части
+    def __init__(self, output_path, job):
+        self.dir = Path(output_path).with_name(Path(output_path).name + ".parts")
+        self.manifest_path = self.dir / "manifest.json"
+        self.job = job
+        self.state = {}
+        self.parts = []
+
+    def load(self):
+        manifest = None
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+
+        if manifest and manifest.get("job") == self.job:
+            self.state = manifest.get("state", {})
+            self.parts = [part for part in manifest.get("parts", []) if (self.dir / part["file"]).exists()]
+        else:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        return bool(self.parts)
+
+    def path(self, name):
+        return str(self.dir / name)
+
+    def next_frame(self):
+        return max((part["end"] for part in self.parts), default=0)
+
+    def add_part(self, **part):
+        self.parts.append(part)
+        self.save()
+
+    def save(self):
+        temp_path = self.manifest_path.with_suffix(".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"job": self.job, "state": self.state, "parts": self.parts}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class CheckpointWriter:
+    # Пишет видео частями по part_frames кадров, каждая закрытая часть сразу попадает в манифест
+    def __init__(self, checkpoint, width, height, fps, codec, preset, start_frame, part_frames):
+        self.checkpoint = checkpoint
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.part_start = start_frame
+        self.part_frames = part_frames
+        self.returncode = 0
+        self.open_part()
+
+    def open_part(self):
+        self.part_file = f"part_{len(self.checkpoint.parts):05d}.mkv"
+        self.part_count = 0
+        self.writer = FFmpegWriter(
+            self.checkpoint.path(self.part_file), self.width, self.height, self.fps,
+            codec=self.codec, preset=self.preset
+        )
+
+    def close_part(self):
+        self.writer.release()
+        if self.part_count == 0:
+            try:
+                os.remove(self.checkpoint.path(self.part_file))
+            except OSError:
+                pass
+            return True
+        if self.writer.returncode != 0:
+            self.returncode = self.writer.returncode
+            return False
+        part_end = self.part_start + self.part_count
+        self.checkpoint.add_part(file=self.part_file, start=self.part_start, end=part_end)
+        self.part_start = part_end
+        return True
+
+    def isOpened(self):
+        return self.writer is not None and self.writer.isOpened()
+
+    def write(self, frame):
+        self.writer.write(frame)
+        self.part_count += 1
+        if self.part_count >= self.part_frames:
+            if not self.close_part():
+                raise RuntimeError("ffmpeg не смог закодировать видео")
+            self.open_part()
+
+    def release(self):
+        if self.writer is not None:
+            self.close_part()
+            self.writer = None
+
+
+CACHE_DEFAULT_LIMIT = 2 * 2**30
+CACHE_HASH_CHUNK = 2**20
+CACHE_MAX_HASHES = 10_000
+_cache_lock = threading.Lock()
+
+
+def app_data_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "MediaUpscaler"
+
+
+def default_cache_dir():
+    return app_data_dir() / "results"
+
+
+def place_file(source, target):
+    # Жёсткая ссылка - мгновенно и без второй копии на диске; между разными дисками - обычное копирование
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def write_json_atomic(path, data):
+    temp_path = Path(path).with_name(f"{Path(path).name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+class ResultCache:
+    # Готовые результаты по ключу: хеш содержимого исходника + размер + все настройки, влияющие на результат.
+    # Общего индекса нет: у каждой записи свой <ключ>.json, время его изменения - отметка для LRU.
+    # Так кэш безопасно делят потоки GUI и процессы консольного режима - гонка даёт лишь лишний промах.
+    # Хеш исходника запоминается по пути, размеру и mtime, и повторно файл целиком не читается
+    def __init__(self, directory=None, limit=CACHE_DEFAULT_LIMIT):
+        self.dir = Path(directory) if directory else default_cache_dir()
+        self.limit = limit
+        self.hashes_path = self.dir / "hashes.json"
+
+    def load_hashes(self):
+        try:
+            with open(self.hashes_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        name = os.path.abspath(path)
+        known = self.load_hashes().get(name)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+            return known["digest"]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CACHE_HASH_CHUNK), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        with _cache_lock:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            hashes = self.load_hashes()
+            hashes[name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "digest": digest}
+            if len(hashes) > CACHE_MAX_HASHES:
+                # Словарь хранит порядок вставки - выбрасываем самые старые записи
+                hashes = dict(list(hashes.items())[-CACHE_MAX_HASHES:])
+            write_json_atomic(self.hashes_path, hashes)
+        return digest
+
+    def key(self, path, params):
+        payload = json.dumps(dict(params, content=self.content_hash(path)), sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def fetch(self, key, output_path):
+        meta_path = self.dir / f"{key}.json"
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            cached = self.dir / meta["file"]
+            # Результат связан с кэшем жёсткой ссылкой: если его переписали на месте, запись уже не годится
+            if cached.stat().st_size != meta["size"]:
+                raise OSError
+        except (OSError, ValueError, KeyError):
+            self.drop(key)
+            return False
+        place_file(cached, output_path)
+        os.utime(meta_path)
+        return True
+
+    def store(self, key, output_path):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        name = f"{key}{Path(output_path).suffix.lower()}"
+        temp_path = self.dir / f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        place_file(output_path, temp_path)
+        os.replace(temp_path, self.dir / name)
+        write_json_atomic(self.dir / f"{key}.json", {"file": name, "size": os.path.getsize(output_path)})
+        self.evict()
+
+    def drop(self, key):
+        meta_path = self.dir / f"{key}.json"
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                name = json.load(f).get("file")
+        except (OSError, ValueError):
+            name = None
+        for path in (meta_path, self.dir / name if name else None):
+            if path is not None and path.exists():
+                path.unlink()
+
+    def entries(self):
+        entries = []
+        for meta_path in self.dir.glob("*.json"):
+            if meta_path == self.hashes_path:
+                continue
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    size = json.load(f)["size"]
+                entries.append((meta_path.stat().st_mtime, size, meta_path.stem))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self):
+        with _cache_lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.limit:
+                    break
+                self.drop(key)
+                total -= size
+
+
+WATCH_POLL_INTERVAL = 2.0
+WATCH_RESCAN_INTERVAL = 60.0
+WATCH_SETTLE_SECONDS = 2.0
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    # inotify через libc без сторонних пакетов; на Windows и macOS конструктор падает с OSError - тогда опрос папки
+    def __init__(self, directory):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError, TypeError):
+            raise OSError("inotify недоступен")
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if add_watch(self.fd, os.fsencode(str(directory)), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch")
+
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_state_path(directory):
+    name = hashlib.sha256(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+    return app_data_dir() / "watch" / f"{name}.json"
+
+
+class FolderWatcher:
+    # Новые и изменённые медиафайлы в папке (без подпапок - туда пишутся результаты).
+    # Файл считается дописанным, когда его размер и mtime не меняются settle секунд.
+    # Обработанные файлы (имя -> размер и mtime) хранятся на диске, после перезапуска они не берутся повторно.
+    # inotify не видит запись с другой машины в сетевую папку, поэтому и с ним папка изредка пересматривается целиком
+    def __init__(self, directory, state_path=None, settle=WATCH_SETTLE_SECONDS, use_inotify=True):
+        self.dir = Path(directory)
+        self.state_path = Path(state_path) if state_path else watch_state_path(directory)
+        self.settle = settle
+        self.lock = threading.Lock()
+        self.processed = self.load_state()
+        self.queued = {}
+        self.pending = {}
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify(self.dir)
+            except OSError:
+                pass
+        self.rescan_interval = WATCH_RESCAN_INTERVAL if self.inotify else WATCH_POLL_INTERVAL
+        self.next_scan = 0.0
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return {name: tuple(signature) for name, signature in json.load(f)["files"].items()}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.state_path, {"dir": os.path.abspath(self.dir), "files": self.processed})
+
+    def signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def touch(self, name, signature=None):
+        if Path(name).suffix.lower() not in MEDIA_EXTENSIONS or name.startswith("."):
+            return
+        signature = signature or self.signature(self.dir / name)
+        if signature is None:
+            self.pending.pop(name, None)
+            return
+        with self.lock:
+            if self.processed.get(name) == signature or self.queued.get(name) == signature:
+                return
+        known = self.pending.get(name)
+        if known is None or known[0] != signature:
+            self.pending[name] = (signature, time.monotonic())
+
+    def scan(self):
+        seen = set()
+        with os.scandir(self.dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                self.touch(entry.name, (stat.st_size, stat.st_mtime_ns))
+        with self.lock:
+            # Удалённые из папки файлы забываем, чтобы состояние не росло бесконечно
+            gone = [name for name in self.processed if name not in seen]
+            for name in gone:
+                del self.processed[name]
+            if gone:
+                self.save_state()
+
+    def settled(self):
+        ready = []
+        now = time.monotonic()
+        for name, (signature, since) in list(self.pending.items()):
+            current = self.signature(self.dir / name)
+            if current is None:
+                del self.pending[name]
+            elif current != signature:
+                self.pending[name] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[name]
+                with self.lock:
+                    self.queued[name] = signature
+                ready.append(str(self.dir / name))
+        return ready
+
+    def poll(self, timeout=WATCH_POLL_INTERVAL):
+        # Ждёт событий не дольше timeout и возвращает файлы, которые можно брать в работу
+        if self.inotify:
+            for name in self.inotify.read(timeout):
+                self.touch(name)
+        else:
+            time.sleep(timeout)
+        if time.monotonic() >= self.next_scan:
+            self.scan()
+            self.next_scan = time.monotonic() + self.rescan_interval
+        return self.settled()
+
+    def hold(self, path):
+        # Файл уже взят в работу прежним наблюдателем - повторно не выдаём, пока не будет mark_done
+        path = Path(path)
+        signature = self.signature(path)
+        if path.parent.resolve() == self.dir.resolve() and signature is not None:
+            with self.lock:
+                self.queued[path.name] = signature
+
+    def mark_done(self, path):
+        name = Path(path).name
+        with self.lock:
+            signature = self.queued.pop(name, None) or self.signature(path)
+            if signature is not None:
+                self.processed[name] = tuple(signature)
+                self.save_state()
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+
+GIF_DEFAULT_DURATION = 100
+GIF_ALPHA_THRESHOLD = 128
+GIF_TRANSPARENT_INDEX = 255
+GIF_ENGINES = ("shared", "per-frame")
+GIF_PALETTE_SAMPLES = 16
+GIF_PALETTE_SAMPLE_SIZE = 160
+
+
+def gif_frame_info(img):
+    # После seek Pillow отдаёт кадр уже собранным на холсте, а info - со своими duration/disposal
+    duration = img.info.get('duration', GIF_DEFAULT_DURATION)
+    disposal = getattr(img, 'disposal_method', 0) or 0
+    return duration, disposal
+
+
+def pad_palette(image):
+    palette = image.getpalette()
+    image.putpalette(palette + [0] * (768 - len(palette)))
+    return image
+
+
+def build_gif_palette(img, frame_count):
+    # Одна палитра на всю анимацию: медианное сечение по уменьшенным кадрам, взятым равномерно.
+    # Подбирать палитру заново для каждого кадра в разы дороже, и цвета между кадрами "плавают"
+    step = max(1, frame_count // GIF_PALETTE_SAMPLES)
+    indices = list(range(0, frame_count, step))[:GIF_PALETTE_SAMPLES]
+    mosaic = Image.new("RGB", (GIF_PALETTE_SAMPLE_SIZE * len(indices), GIF_PALETTE_SAMPLE_SIZE))
+    for position, index in enumerate(indices):
+        img.seek(index)
+        tile = img.convert("RGBA")
+        tile.thumbnail((GIF_PALETTE_SAMPLE_SIZE, GIF_PALETTE_SAMPLE_SIZE), Image.Resampling.BILINEAR)
+        # Прозрачные пиксели в палитру не попадают - под них зарезервирован отдельный индекс
+        mosaic.paste(tile.convert("RGB"), (position * GIF_PALETTE_SAMPLE_SIZE, 0), mask=tile.getchannel("A"))
+    img.seek(0)
+    return pad_palette(mosaic.quantize(GIF_TRANSPARENT_INDEX, method=Image.Quantize.MEDIANCUT))
+
+
+def quantize_gif_frame(frame, palette=None):
+    # 255 цветов под изображение, индекс 255 - под прозрачность
+    rgba = frame if frame.mode == "RGBA" else frame.convert("RGBA")
+    alpha = rgba.getchannel("A")
+    if palette is None:
+        result = pad_palette(
+            rgba.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE, colors=GIF_TRANSPARENT_INDEX)
+        )
+    else:
+        # Без дизеринга: с общей палитрой он даёт "кипящий" шум между кадрами
+        result = rgba.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+
+    transparency = None
+    if alpha.getextrema()[0] < GIF_ALPHA_THRESHOLD:
+        mask = alpha.point(lambda a: 255 if a < GIF_ALPHA_THRESHOLD else 0)
+        result.paste(GIF_TRANSPARENT_INDEX, mask=mask)
+        transparency = GIF_TRANSPARENT_INDEX
+    return result, transparency
+
+
+def render_gif_frame(frame, size, palette, profiler):
+    with profiler.stage("resize"):
+        frame = frame.resize(size, Image.Resampling.LANCZOS)
+    with profiler.stage("quantize"):
+        return quantize_gif_frame(frame, palette)
+
+
+class GifWriter:
+    # Пишет GIF по одному кадру, не держа анимацию в памяти: заголовок берётся с первого кадра,
+    # дальше каждый кадр идёт со своей длительностью и способом очистки. С общей палитрой
+    # она лежит один раз в заголовке, иначе у каждого кадра своя
+    def __init__(self, path, loop=0, local_palettes=True):
+        self.file = open(path, 'wb')
+        self.loop = loop
+        self.local_palettes = local_palettes
+        self.pending = None
+        self.frame_count = 0
+
+    def write(self, frame, duration, disposal=0, transparency=None):
+        if self.pending is not None:
+            if transparency is not None:
+                # Кадры пишутся целиком, поэтому сквозь прозрачные пиксели должен быть виден фон,
+                # а не предыдущий кадр - его нужно очистить
+                self.pending[2] = 2
+            self.flush()
+        self.pending = [frame, duration, disposal, transparency]
+
+    def flush(self):
+        frame, duration, disposal, transparency = self.pending
+        self.pending = None
+
+        params = {"duration": duration, "disposal": disposal, "include_color_table": self.local_palettes}
+        if transparency is not None:
+            params["transparency"] = transparency
+
+        if self.frame_count == 0:
+            info = {"loop": self.loop, "duration": duration}
+            header, _ = GifImagePlugin.getheader(frame, None, info)
+            for chunk in header:
+                self.file.write(chunk)
+        for chunk in GifImagePlugin.getdata(frame, (0, 0), **params):
+            self.file.write(chunk)
+        self.frame_count += 1
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            if self.pending is not None:
+                self.flush()
+            self.file.write(b";")
+        finally:
+            self.file.close()
+            self.file = None
+
+
+def upscale_segment(src_path, dst_path, width, height, interpolation, codec, preset, progress_queue, index,
+                    stop_event=None, trace=False, pyramid=0, dedupe=False):
+    cv2.setNumThreads(1)
+    profiler = StageProfiler(trace=trace)
+
+    cap = cv2.VideoCapture(src_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Не удалось открыть сегмент {index}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        fps = 60.0
+
+    out = FFmpegWriter(dst_path, width, height, fps, codec=codec, preset=preset)
+    if not out.isOpened():
+        cap.release()
+        raise RuntimeError(f"Не удалось записать сегмент {index}")
+
+    def read_frame():
+        if stop_event is not None and stop_event.is_set():
+            raise UpscaleCancelled("Отменено")
+        ret, frame = cap.read()
+        return frame if ret else None
+
+    # Повторы ищутся внутри сегмента: на его границе первый кадр просто считается заново
+    duplicates = DuplicateFrameFilter() if dedupe and interpolation is not None else None
+
+    def process_frame(frame):
+        if interpolation is None:
+            return frame
+        output = np.empty((height, width, frame.shape[2]), dtype=np.uint8)
+        if duplicates is not None and duplicates.lookup(frame, output):
+            return output
+        if pyramid:
+            output = pyramid_resize(frame, (width, height), pyramid, dst=output)
+        else:
+            output = cv2.resize(frame, (width, height), dst=output, interpolation=interpolation)
+        if duplicates is not None:
+            duplicates.store(output)
+        return output
+
+    written = [0]
+
+    def write_frame(frame):
+        out.write(frame)
+        written[0] += 1
+        if written[0] % 10 == 0:
+            progress_queue.put((index, written[0]))
+
+    try:
+        frame_count = run_frame_pipeline(read_frame, process_frame, write_frame, profiler=profiler)
+    finally:
+        cap.release()
+        with profiler.stage("finalize"):
+            out.release()
+    if out.returncode != 0:
+        raise RuntimeError(f"Не удалось закодировать сегмент {index}")
+    progress_queue.put((index, frame_count))
+    return frame_count, profiler.export(), duplicates.stats() if duplicates is not None else None
+
+
+class Upscaler:
+    def __init__(self, input_path, output_path, width, height, file_type,
+                 parallel=False, codec="libx264", preset="medium", engine="auto", decoder="auto",
+                 resumable=False, dedupe=False, telemetry=None, trace_path=None, gif_engine="shared",
+                 workers=None, fast_downscale=True, image_profile="quality", cache=None,
+                 start_time=None, end_time=None, start_frame=None, end_frame=None, ladder=()):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.file_type = file_type
+        self.parallel = parallel
+        # H.264/H.265 кладутся не во всякий контейнер, ступени лестницы пишутся в тот же контейнер
+        self.codec = container_codec(output_path, codec)
+        self.preset = preset
+        self.engine = engine
+        self.decoder = decoder
+        self.resumable = resumable
+        self.dedupe = dedupe
+        self.stats = {}
+        self.telemetry = telemetry or Telemetry()
+        self.cancel_event = threading.Event()
+        self.process = None
+        self.trace_path = trace_path
+        self.gif_engine = gif_engine
+        self.fast_downscale = fast_downscale
+        self.image_profile = image_profile
+        self.cache = cache
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.clip = None
+        self.fps = 0.0
+        # Дополнительные ступени (ширина, высота, путь) к основному результату - из одного декодирования
+        self.ladder = list(ladder)
+        self.workers = workers or os.cpu_count() or 1
+        self.profiler = StageProfiler(trace=bool(trace_path))
+
+    def run(self):
+        try:
+            key = None
+            # Лестница - несколько файлов за раз, в кэш результатов её не кладём
+            if self.cache is not None and not self.ladder:
+                with self.profiler.stage("cache"):
+                    key = self.cache.key(self.input_path, self.cache_params())
+                    hit = self.cache.fetch(key, self.output_path)
+                self.stats["cache"] = "hit" if hit else "miss"
+                if hit:
+                    # Сводка и прогресс должны показать кадры готового результата, как после обычной обработки
+                    self.telemetry.start(self.cached_frames())
+                    self.telemetry.finish()
+                    return self.output_path
+
+            output_path = self.upscale()
+            if key is not None:
+                try:
+                    self.cache.store(key, output_path)
+                except OSError:
+                    # Кэш - только ускорение: не смогли сохранить, результат всё равно готов
+                    pass
+            return output_path
+        except Exception:
+            # Недописанный результат не нужен ни при отмене, ни при ошибке. Папка .parts остаётся,
+            # только если в неё успел попасть манифест - иначе возобновлять нечего
+            for _, _, path in self.renditions():
+                if os.path.exists(path):
+                    os.remove(path)
+            checkpoint = JobCheckpoint(self.output_path, None)
+            if not checkpoint.manifest_path.exists():
+                checkpoint.remove()
+            raise
+        finally:
+            self.stats["profile"] = self.profiler.summary()
+            if self.trace_path:
+                try:
+                    self.profiler.write_trace(self.trace_path)
+                    self.stats["trace"] = self.trace_path
+                except OSError:
+                    pass
+
+    def cached_frames(self):
+        if self.file_type == 'image':
+            return 1
+        try:
+            return probe_media(self.output_path, self.file_type)["frame_count"]
+        except (UpscaleError, OSError):
+            return 0
+
+    def upscale(self):
+        if self.file_type in ['image', 'gif']:
+            output_path = self.upscale_image()
+            for width, height, path in self.ladder:
+                # Картинку заново открыть дёшево - общий проход ради экономии декодирования нужен только видео
+                rendition = copy.copy(self)
+                rendition.width, rendition.height, rendition.output_path = width, height, path
+                rendition.upscale_image()
+            return output_path
+        if self.file_type == 'video':
+            return self.upscale_video()
+        raise UpscaleError("Неподдерживаемый тип файла")
+
+    def cache_params(self):
+        # Всё, от чего зависит результат; resumable и число потоков на него не влияют
+        return {
+            "width": self.width, "height": self.height, "file_type": self.file_type,
+            "output": Path(self.output_path).suffix.lower(),
+            "engine": self.engine, "decoder": self.decoder, "parallel": self.parallel,
+            "codec": self.codec, "preset": self.preset, "dedupe": self.dedupe,
+            "fast_downscale": self.fast_downscale, "gif_engine": self.gif_engine,
+            "image_profile": self.image_profile,
+            "range": self.range_params(),
+        }
+
+    def renditions(self):
+        return [(self.width, self.height, self.output_path), *self.ladder]
+
+    def range_params(self):
+        return [self.start_time, self.end_time, self.start_frame, self.end_frame]
+
+    def cancel(self):
+        self.cancel_event.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise UpscaleCancelled("Отменено")
+
+    def upscale_image(self):
+        profiler = self.profiler
+        size = (self.width, self.height)
+        is_gif = self.input_path.lower().endswith('.gif')
+        with profiler.stage("load"):
+            img = open_image(self.input_path)
+            if self.fast_downscale and not is_gif:
+                img = draft_image(img, size)
+
+        if is_gif:
+            self.upscale_gif(img)
+        elif needs_strip_resize(img.size, size) and strip_work_mode(img) is not None:
+            self.upscale_image_strips(img)
+        else:
+            self.telemetry.start(2, stages=True)
+            with profiler.stage("resize"):
+                if self.fast_downscale and downscale_factor(img.size, size) >= 2:
+                    # reduce() усредняет целые блоки пикселей, LANCZOS доводит остаток до точного размера
+                    result = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=DOWNSCALE_GAP)
+                elif needs_tiled_resize(img.size, (self.width, self.height)):
+                    result = get_tiled_resizer().resize_image(img, (self.width, self.height))
+                else:
+                    result = img.resize((self.width, self.height), Image.Resampling.LANCZOS)
+            self.telemetry.update(1)
+            self.check_cancelled()
+
+            with profiler.stage("save"):
+                pil_format, options = encoder_options(self.output_path, self.image_profile)
+                save_image(convert_for_format(result, pil_format), self.output_path, pil_format, **options)
+
+        self.telemetry.finish()
+        return self.output_path
+
+    def upscale_image_strips(self, img):
+        # Огромные сканы и панорамы: исходник декодируется в файл на диске, результат считается
+        # и пишется полосами - память зависит от высоты полосы, а не от размера картинки
+        profiler = self.profiler
+        size = (self.width, self.height)
+        pil_format, options = encoder_options(self.output_path, self.image_profile)
+        mode = strip_work_mode(img)
+        if mode not in FORMAT_MODES.get(pil_format, (mode,)):
+            mode = "RGB"
+        strips = split_strips(img.size, size)
+        resizer = get_tiled_resizer()
+        self.telemetry.start(len(strips) + 1, stages=True)
+
+        def render(bounds):
+            with profiler.stage("resize"):
+                strip = resize_strip(img, size, bounds, mode)
+            with profiler.stage("filter"):
+                return writer.prepare(strip)
+
+        work_dir = tempfile.mkdtemp(prefix="strips_", dir=str(Path(self.output_path).parent))
+        try:
+            with profiler.stage("decode"):
+                img = map_image(img, os.path.join(work_dir, "source.raw"))
+            self.telemetry.add()
+            self.check_cancelled()
+
+            if pil_format == "PNG":
+                writer = PngStripWriter(self.output_path, size, mode, img.info.get("icc_profile"), **options)
+            else:
+                writer = MappedStripWriter(
+                    self.output_path, size, mode, os.path.join(work_dir, "result.raw"), pil_format, **options
+                )
+
+            pending = deque()
+
+            def write_next():
+                top, future = pending.popleft()
+                strip = future.result()
+                with profiler.stage("encode"):
+                    writer.write(top, strip)
+                self.telemetry.add()
+
+            try:
+                for bounds in strips:
+                    self.check_cancelled()
+                    pending.append((bounds[0], resizer.pool.submit(render, bounds)))
+                    if len(pending) >= resizer.workers * 2:
+                        write_next()
+                while pending:
+                    self.check_cancelled()
+                    write_next()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+                with profiler.stage("finalize"):
+                    writer.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def upscale_gif(self, img):
+        # Кадры идут потоком: прочитан, увеличен, квантован, записан - память не зависит от их числа.
+        # Ресайз и квантование - в пуле потоков (Pillow отпускает GIL), в работе не больше двух кадров на поток
+        profiler = self.profiler
+        frame_count = getattr(img, 'n_frames', 1)
+        size = (self.width, self.height)
+        self.telemetry.start(frame_count)
+
+        palette = None
+        if self.gif_engine == "shared":
+            with profiler.stage("palette"):
+                palette = build_gif_palette(img, frame_count)
+
+        writer = GifWriter(self.output_path, loop=img.info.get('loop', 0), local_palettes=palette is None)
+        pending = deque()
+
+        def write_next():
+            future, duration, disposal = pending.popleft()
+            frame, transparency = future.result()
+            with profiler.stage("encode"):
+                writer.write(frame, duration, disposal, transparency)
+            self.telemetry.add()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    for index in range(frame_count):
+                        self.check_cancelled()
+                        with profiler.stage("decode"):
+                            img.seek(index)
+                            frame = img.convert("RGBA")
+                            duration, disposal = gif_frame_info(img)
+                        future = executor.submit(render_gif_frame, frame, size, palette, profiler)
+                        pending.append((future, duration, disposal))
+                        if len(pending) >= self.workers * 2:
+                            write_next()
+                    while pending:
+                        self.check_cancelled()
+                        write_next()
+                finally:
+                    for future, _, _ in pending:
+                        future.cancel()
+        except EOFError:
+            raise UpscaleError("Не удалось прочитать GIF")
+        finally:
+            with profiler.stage("finalize"):
+                writer.close()
+
+    def upscale_video(self):
+        with self.profiler.stage("probe"):
+            info = probe_media(self.input_path, 'video')
+
+        fps = info["fps"]
+        self.fps = fps
+        if any(value is not None for value in self.range_params()):
+            self.clip = self.clip_frames(info)
+        total_frames = self.clip[1] - self.clip[0] if self.clip else info["frame_count"]
+        orig_width = info["width"]
+        orig_height = info["height"]
+        self.telemetry.start(total_frames)
+
+        is_upscaling = (self.width > orig_width) or (self.height > orig_height)
+        same_size = (self.width == orig_width) and (self.height == orig_height)
+
+        if same_size:
+            interpolation = None
+        elif is_upscaling:
+            interpolation = cv2.INTER_LANCZOS4
+        else:
+            interpolation = cv2.INTER_AREA
+        pyramid = 0
+        if interpolation == cv2.INTER_AREA and self.fast_downscale:
+            pyramid = pyramid_levels((orig_width, orig_height), (self.width, self.height))
+
+        has_ffmpeg = shutil.which("ffmpeg") is not None
+
+        renditions = self.renditions()
+        if self.ladder and self.clip is None:
+            # Ступень в размер исходника - просто копия файла, как и у отдельной задачи
+            for width, height, path in renditions:
+                if (width, height) == (orig_width, orig_height):
+                    with self.profiler.stage("copy"):
+                        shutil.copyfile(self.input_path, path)
+            renditions = [r for r in renditions if r[:2] != (orig_width, orig_height)]
+            if not renditions:
+                self.telemetry.finish()
+                return self.output_path
+
+        # Покадровая лестница не умеет сегменты, возобновление и пропуск повторов - в авто-режиме её делает ffmpeg
+        native = self.use_native_engine(has_ffmpeg) or bool(self.ladder and has_ffmpeg and self.engine == "auto")
+        if native:
+            if same_size and self.clip is None and not self.ladder:
+                with self.profiler.stage("copy"):
+                    shutil.copyfile(self.input_path, self.output_path)
+                self.telemetry.finish()
+                return self.output_path
+            with self.profiler.stage("ffmpeg_scale"):
+                scaled = self.scale_video_ffmpeg(renditions, (orig_width, orig_height))
+            if scaled:
+                self.telemetry.finish()
+                return self.output_path
+            self.check_cancelled()
+            # ffmpeg не справился (например, звук не копируется в этот контейнер) - идём покадрово
+
+        if self.ladder:
+            self.upscale_video_ladder(info, renditions, has_ffmpeg)
+            self.telemetry.finish()
+            return self.output_path
+
+        # Сегменты режутся копированием потока - только по ключевым кадрам, точно отрезать фрагмент так нельзя.
+        # Фрагмент идёт одним конвейером, который и так декодирует только нужный кусок
+        workers = self.segment_workers(total_frames, fps) if has_ffmpeg and self.clip is None else 1
+        if workers > 1:
+            self.upscale_video_segments(total_frames, fps, interpolation, workers, pyramid)
+        else:
+            self.upscale_video_frames(info, interpolation, has_ffmpeg, pyramid)
+
+        self.telemetry.finish()
+        return self.output_path
+
+    def clip_frames(self, info):
+        # Диапазон кадров [first, last); номера кадров точнее времени, поэтому при наличии берутся они
+        fps = info["fps"]
+        first = self.start_frame if self.start_frame is not None else round((self.start_time or 0) * fps)
+        if self.end_frame is not None:
+            last = self.end_frame
+        elif self.end_time is not None:
+            last = round(self.end_time * fps)
+        else:
+            last = info["frame_count"]
+        if info["frame_count"] > 0:
+            last = min(last, info["frame_count"])
+        if first < 0 or last <= first:
+            raise UpscaleError("Пустой фрагмент: начало за концом видео или позже конца фрагмента")
+        return first, last
+
+    def seek_args(self, start_frame):
+        # -ss перед -i: ffmpeg прыгает к ближайшему ключевому кадру и декодирует только от него
+        return ["-ss", f"{seek_time(start_frame, self.fps):.6f}"] if start_frame > 0 else []
+
+    def audio_args(self):
+        if self.clip is None:
+            return []
+        first, last = self.clip
+        return ["-ss", f"{first / self.fps:.6f}", "-t", f"{(last - first) / self.fps:.6f}"]
+
+    def upscale_video_frames(self, info, interpolation, has_ffmpeg, pyramid=0):
+        fps = info["fps"]
+        orig_width = info["width"]
+        orig_height = info["height"]
+        clip_start, clip_end = self.clip or (0, None)
+
+        checkpoint = None
+        start_frame = 0
+        if self.resumable and has_ffmpeg:
+            checkpoint = JobCheckpoint(self.output_path, self.job_key(mode="frames"))
+            checkpoint.load()
+            start_frame = checkpoint.next_frame()
+
+        remaining = clip_end - clip_start - start_frame if clip_end is not None else None
+        with self.profiler.stage("open"):
+            cap = self.open_reader(orig_width, orig_height, clip_start + start_frame, fps, remaining)
+        if not cap.isOpened():
+            raise UpscaleError("Не удалось открыть видеофайл")
+
+        if checkpoint is not None:
+            out = CheckpointWriter(
+                checkpoint, self.width, self.height, fps, self.codec, self.preset,
+                start_frame, max(1, int(fps * CHECKPOINT_PART_SECONDS))
+            )
+        elif has_ffmpeg:
+            out = FFmpegWriter(
+                self.output_path, self.width, self.height, fps,
+                audio_path=self.input_path, codec=self.codec, preset=self.preset, audio_args=self.audio_args()
+            )
+        else:
+            # Без ffmpeg звук не подмешать, сохраняем хотя бы видео
+            out = cv2.VideoWriter(self.output_path, cv2_fourcc(self.output_path), fps, (self.width, self.height))
+
+        if not out.isOpened():
+            cap.release()
+            raise UpscaleError("Не удалось инициализировать кодировщик видео")
+
+        input_pool = FramePool((orig_height, orig_width, 3))
+        output_pool = FramePool((self.height, self.width, 3))
+
+        read = [0]
+
+        def read_frame():
+            self.check_cancelled()
+            if remaining is not None and read[0] >= remaining:
+                return None
+            read[0] += 1
+            buffer = input_pool.acquire()
+            ret, frame = cap.read(buffer)
+            if not ret:
+                input_pool.release(buffer)
+                return None
+            return frame
+
+        duplicates = DuplicateFrameFilter() if self.dedupe and interpolation is not None else None
+
+        def process_frame(frame):
+            if interpolation is None:
+                return frame
+            output = output_pool.acquire()
+            if duplicates is not None and duplicates.lookup(frame, output):
+                input_pool.release(frame)
+                return output
+            if pyramid:
+                output = pyramid_resize(frame, (self.width, self.height), pyramid, dst=output)
+            else:
+                output = cv2.resize(
+                    frame, (self.width, self.height),
+                    dst=output, interpolation=interpolation
+                )
+            if duplicates is not None:
+                duplicates.store(output)
+            input_pool.release(frame)
+            return output
+
+        written = [start_frame]
+
+        def write_frame(frame):
+            out.write(frame)
+            # Кодировщик уже скопировал кадр в свой буфер, массив можно отдавать обратно
+            if interpolation is None:
+                input_pool.release(frame)
+            else:
+                output_pool.release(frame)
+            written[0] += 1
+            self.telemetry.update(written[0])
+
+        try:
+            run_frame_pipeline(read_frame, process_frame, write_frame, profiler=self.profiler)
+        finally:
+            cap.release()
+            with self.profiler.stage("finalize"):
+                out.release()
+            self.stats["input_pool"] = input_pool.stats()
+            self.stats["output_pool"] = output_pool.stats()
+            if duplicates is not None:
+                self.stats["duplicate_frames"] = duplicates.stats()
+
+        if getattr(out, 'returncode', 0) != 0:
+            raise UpscaleError("ffmpeg не смог закодировать видео")
+
+        if checkpoint is not None:
+            self.check_cancelled()
+            list_path = checkpoint.path("concat.txt")
+            write_concat_list(list_path, [checkpoint.path(part["file"]) for part in checkpoint.parts])
+            with self.profiler.stage("concat"):
+                concatenated = self.concat_to_output(list_path)
+            if not concatenated:
+                raise UpscaleError("Не удалось склеить части видео")
+            checkpoint.remove()
+
+    def ladder_plan(self, renditions, source_size):
+        # Ступени считаются от большей к меньшей. Если готовая ступень больше нужной в целое число раз,
+        # уменьшаем из неё, а не из исходника: INTER_AREA с целым шагом - усреднение блоков, два таких
+        # прохода подряд дают то же, что один (2160p -> 1080p -> 540p), но второй в разы дешевле.
+        # С дробным шагом (1080p -> 720p -> 480p) каскад заметно мылит, тогда - из исходного кадра.
+        # Увеличенные ступени в источники не годятся
+        order = sorted(range(len(renditions)), key=lambda i: renditions[i][0] * renditions[i][1], reverse=True)
+        plan = []
+        for index in order:
+            width, height, _ = renditions[index]
+            source = None
+            for done, _, _, _ in reversed(plan):
+                done_width, done_height, _ = renditions[done]
+                if (done_width <= source_size[0] and done_height <= source_size[1]
+                        and done_width % width == 0 and done_height % height == 0):
+                    source = done
+                    break
+            source_width, source_height = renditions[source][:2] if source is not None else source_size
+            pyramid = 0
+            if (width, height) == (source_width, source_height):
+                interpolation = None
+            elif width > source_width or height > source_height:
+                interpolation = cv2.INTER_LANCZOS4
+            else:
+                interpolation = cv2.INTER_AREA
+                if self.fast_downscale:
+                    pyramid = pyramid_levels((source_width, source_height), (width, height))
+            plan.append((index, source, interpolation, pyramid))
+        return plan
+
+    def upscale_video_ladder(self, info, renditions, has_ffmpeg):
+        fps = info["fps"]
+        orig_width = info["width"]
+        orig_height = info["height"]
+        plan = self.ladder_plan(renditions, (orig_width, orig_height))
+        clip_start, clip_end = self.clip or (0, None)
+        remaining = clip_end - clip_start if clip_end is not None else None
+
+        with self.profiler.stage("open"):
+            cap = self.open_reader(orig_width, orig_height, clip_start, fps, remaining)
+        if not cap.isOpened():
+            raise UpscaleError("Не удалось открыть видеофайл")
+
+        # Каждой ступени - свой процесс ffmpeg со своим звуком: кодирование всех ступеней идёт одновременно
+        writers = []
+        for width, height, path in renditions:
+            if has_ffmpeg:
+                writers.append(FFmpegWriter(
+                    path, width, height, fps,
+                    audio_path=self.input_path, codec=self.codec, preset=self.preset, audio_args=self.audio_args()
+                ))
+            else:
+                writers.append(cv2.VideoWriter(path, cv2_fourcc(path), fps, (width, height)))
+        if not all(writer.isOpened() for writer in writers):
+            cap.release()
+            for writer in writers:
+                writer.release()
+            raise UpscaleError("Не удалось инициализировать кодировщик видео")
+
+        input_pool = FramePool((orig_height, orig_width, 3))
+        pools = [FramePool((height, width, 3)) for width, height, _ in renditions]
+        read = [0]
+
+        def read_frame():
+            self.check_cancelled()
+            if remaining is not None and read[0] >= remaining:
+                return None
+            read[0] += 1
+            buffer = input_pool.acquire()
+            ret, frame = cap.read(buffer)
+            if not ret:
+                input_pool.release(buffer)
+                return None
+            return frame
+
+        def process_frame(frame):
+            outputs = [None] * len(renditions)
+            owned = []
+            for index, source, interpolation, pyramid in plan:
+                source_frame = frame if source is None else outputs[source]
+                if interpolation is None:
+                    outputs[index] = source_frame
+                    continue
+                size = renditions[index][:2]
+                output = pools[index].acquire()
+                if pyramid:
+                    output = pyramid_resize(source_frame, size, pyramid, dst=output)
+                else:
+                    output = cv2.resize(source_frame, size, dst=output, interpolation=interpolation)
+                outputs[index] = output
+                owned.append(index)
+            return frame, outputs, owned
+
+        written = [0]
+
+        def write_frame(item):
+            frame, outputs, owned = item
+            for writer, output in zip(writers, outputs):
+                writer.write(output)
+            for index in owned:
+                pools[index].release(outputs[index])
+            input_pool.release(frame)
+            written[0] += 1
+            self.telemetry.update(written[0])
+
+        try:
+            run_frame_pipeline(read_frame, process_frame, write_frame, profiler=self.profiler)
+        finally:
+            cap.release()
+            with self.profiler.stage("finalize"):
+                for writer in writers:
+                    writer.release()
+            self.stats["input_pool"] = input_pool.stats()
+
+        if any(getattr(writer, 'returncode', 0) != 0 for writer in writers):
+            raise UpscaleError("ffmpeg не смог закодировать видео")
+
+    def job_key(self, **extra):
+        stat = os.stat(self.input_path)
+        job = {
+            "input": os.path.abspath(self.input_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "width": self.width,
+            "height": self.height,
+            "codec": self.codec,
+            "preset": self.preset,
+            "range": self.range_params(),
+        }
+        job.update(extra)
+        return job
+
+    def concat_to_output(self, list_path):
+        # Склейка и звук из исходника - одним проходом, без временного файла
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,
+            *self.audio_args(),
+            "-i", self.input_path,
+            "-map", "0:v:0",
+            "-map", "1:a:0?",
+            "-c:v", "copy",
+            *audio_encoder_args(self.output_path),
+            "-shortest",
+            self.output_path
+        ]
+        return run_ffmpeg(cmd).returncode == 0
+
+    def open_reader(self, width, height, start_frame=0, fps=60.0, frames=None):
+        decoder = self.decoder
+        if decoder == "auto":
+            decoder = "ffmpeg" if shutil.which("ffmpeg") and shutil.which("ffprobe") else "opencv"
+        if decoder == "ffmpeg":
+            start_time = seek_time(start_frame, fps) if start_frame > 0 else 0.0
+            return FFmpegReader(self.input_path, width, height, start_time, frames)
+        # OpenCV тоже ищет позицию от ближайшего ключевого кадра, а не декодирует с начала
+        cap = cv2.VideoCapture(self.input_path)
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        return cap
+
+    def use_native_engine(self, has_ffmpeg):
+        if self.engine == "opencv" or not has_ffmpeg:
+            return False
+        if self.engine == "ffmpeg":
+            return True
+        # Авто: покадровая обработка в Python нужна только для режимов, которые её требуют
+        return not (self.parallel or self.resumable or self.dedupe)
+
+    def scale_video_ffmpeg(self, renditions, source_size):
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-nostats",
+            "-progress", "pipe:1",
+            *self.seek_args(self.clip[0] if self.clip else 0),
+            "-i", self.input_path,
+        ]
+        scales = [
+            f"scale={width}:{height}:flags={'lanczos' if width > source_size[0] or height > source_size[1] else 'area'}"
+            for width, height, _ in renditions
+        ]
+        if len(renditions) > 1:
+            # Лестница: один декодер, split раздаёт кадр всем scale, у каждого выхода свой кодировщик и свой звук
+            labels = [f"[v{index}]" for index in range(len(renditions))]
+            graph = f"[0:v:0]split={len(renditions)}" + "".join(f"[s{index}]" for index in range(len(renditions)))
+            graph += "".join(f";[s{index}]{scale}{label}" for index, (scale, label) in enumerate(zip(scales, labels)))
+            cmd += ["-filter_complex", graph]
+        for index, (width, height, path) in enumerate(renditions):
+            if len(renditions) > 1:
+                cmd += ["-map", labels[index], "-map", "0:a:0?"]
+            else:
+                cmd += ["-map", "0:v:0", "-map", "0:a:0?", "-vf", scales[index]]
+            if self.clip is not None:
+                # -frames:v - точное число кадров, -t обрезает звук под ту же длительность
+                first, last = self.clip
+                cmd += ["-frames:v", str(last - first), "-t", f"{(last - first) / self.fps:.6f}"]
+            cmd += video_encoder_args(self.codec, self.preset, width, height)
+            cmd += [
+                *passthrough_args(),
+                "-c:a", "copy",
+                path
+            ]
+
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        self.process = process
+        if self.cancel_event.is_set():
+            process.kill()
+
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "frame" and value.isdigit():
+                self.telemetry.update(int(value))
+        process.wait()
+        self.process = None
+
+        if process.returncode != 0:
+            for _, _, path in renditions:
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+        return True
+
+    def segment_workers(self, total_frames, fps):
+        if not self.parallel or total_frames <= 0:
+            return 1
+        # Сегменты короче пары секунд не окупают запуск процесса
+        duration = total_frames / fps
+        return max(1, min(os.cpu_count() or 1, int(duration // 2)))
+
+    def upscale_video_segments(self, total_frames, fps, interpolation, workers, pyramid=0):
+        # Нарезка без перекодирования: segment-муксер режет только по ключевым кадрам,
+        # сегментов делаем вдвое больше, чем процессов, чтобы выровнять нагрузку
+        segment_time = max((total_frames / fps) / (workers * 2), 1.0)
+
+        checkpoint = None
+        if self.resumable:
+            checkpoint = JobCheckpoint(
+                self.output_path, self.job_key(mode="segments", segment_time=round(segment_time, 3))
+            )
+            checkpoint.load()
+            work_dir = str(checkpoint.dir)
+        else:
+            work_dir = tempfile.mkdtemp(prefix="segments_", dir=str(Path(self.output_path).parent))
+
+        try:
+            if checkpoint is None or not checkpoint.state.get("split"):
+                split_cmd = [
+                    "ffmpeg",
+                    "-y",
+                    "-i", self.input_path,
+                    "-map", "0:v:0",
+                    "-c", "copy",
+                    "-f", "segment",
+                    "-segment_time", f"{segment_time:.3f}",
+                    "-reset_timestamps", "1",
+                    os.path.join(work_dir, "src_%05d.mkv")
+                ]
+                with self.profiler.stage("split"):
+                    split = run_ffmpeg(split_cmd)
+                if split.returncode != 0:
+                    raise UpscaleError("Не удалось разделить видео на сегменты")
+                if checkpoint is not None:
+                    checkpoint.state["split"] = True
+                    checkpoint.save()
+            self.check_cancelled()
+
+            sources = sorted(Path(work_dir).glob("src_*.mkv"))
+            if not sources:
+                raise UpscaleError("Не удалось разделить видео на сегменты")
+            targets = [str(src.with_name(src.stem.replace("src_", "dst_") + ".mkv")) for src in sources]
+
+            done = [0] * len(sources)
+            finished_parts = set()
+            if checkpoint is not None:
+                for part in checkpoint.parts:
+                    done[part["index"]] = part["end"] - part["start"]
+                    finished_parts.add(part["index"])
+            pending = [index for index in range(len(sources)) if index not in finished_parts]
+
+            # spawn, а не fork: в GUI процесс многопоточный (Qt, соседние задачи), и форк мог унести
+            # в дочерний процесс чужую захваченную блокировку
+            context = multiprocessing.get_context("spawn")
+            with context.Manager() as manager:
+                progress_queue = manager.Queue()
+                stop_event = manager.Event()
+
+                with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending))), mp_context=context) as pool:
+                    futures = {
+                        pool.submit(
+                            upscale_segment, str(sources[index]), targets[index], self.width, self.height,
+                            interpolation, self.codec, self.preset, progress_queue, index, stop_event,
+                            self.profiler.events is not None, pyramid, self.dedupe
+                        ): index
+                        for index in pending
+                    }
+
+                    try:
+                        self.telemetry.update(sum(done))
+                        while futures or not progress_queue.empty():
+                            self.check_cancelled()
+
+                            try:
+                                index, count = progress_queue.get(timeout=0.2)
+                                done[index] = count
+                            except queue.Empty:
+                                pass
+
+                            for future in [f for f in futures if f.done()]:
+                                index = futures.pop(future)
+                                frame_count, profile, duplicate_stats = future.result()
+                                self.profiler.merge(profile)
+                                if duplicate_stats is not None:
+                                    totals = self.stats.setdefault("duplicate_frames", {"checked": 0, "skipped": 0})
+                                    for key, value in duplicate_stats.items():
+                                        totals[key] += value
+                                if checkpoint is not None:
+                                    checkpoint.add_part(
+                                        file=Path(targets[index]).name, index=index, start=0, end=frame_count
+                                    )
+
+                            self.telemetry.update(sum(done))
+                    except BaseException:
+                        # Отмена или упавший сегмент: сегменты в работе дочитают текущий кадр и остановятся,
+                        # ждущие - не стартуют, иначе выход из пула ждал бы всю очередь
+                        stop_event.set()
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+            list_path = os.path.join(work_dir, "concat.txt")
+            write_concat_list(list_path, targets)
+
+            with self.profiler.stage("concat"):
+                concatenated = self.concat_to_output(list_path)
+            if not concatenated:
+                raise UpscaleError("Не удалось склеить сегменты видео")
+
+            if checkpoint is not None:
+                checkpoint.remove()
+        finally:
+            if checkpoint is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def detect_file_type(path):
+    ext = Path(path).suffix.lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in GIF_EXTENSIONS:
+        return 'gif'
+    return 'video'
+
+
+def media_size(path, file_type=None):
+    # Для размеров точное число кадров не нужно - MKV и WebM не демультиплексируются целиком
+    info = probe_media(path, file_type, count_frames=False)
+    return info["width"], info["height"]
+
+
+def next_output_path(input_path, base_dir=None, taken=(), suffix=None, label="upscaled"):
+    source = Path(input_path)
+    base_dir = Path(base_dir) if base_dir else source.parent
+    base_stem = f"{source.stem}_{label}"
+    file_ext = suffix or source.suffix.lower()
+
+    candidate = base_dir / f"{base_stem}{file_ext}"
+    counter = 1
+    while candidate.exists() or str(candidate) in taken:
+        candidate = base_dir / f"{base_stem}_{counter}{file_ext}"
+        counter += 1
+    return str(candidate)
+
+
+def target_size(src_size, size=None, scale=None):
+    if size is not None:
+        width, height = size
+        # 0 по одной из сторон - сохранить пропорции
+        if width <= 0:
+            width = round(src_size[0] * height / src_size[1])
+        if height <= 0:
+            height = round(src_size[1] * width / src_size[0])
+    else:
+        width = round(src_size[0] * scale)
+        height = round(src_size[1] * scale)
+    return max(width, 1), max(height, 1)
+
+
+def ladder_sizes(src_size, heights):
+    # Ширина по пропорциям исходника, округлённая до чётной - yuv420p требует чётных сторон
+    return [(max(2, round(src_size[0] * height / src_size[1] / 2) * 2), height) for height in heights]
+
+
+def ladder_output_paths(input_path, heights, base_dir=None, taken=(), suffix=None):
+    paths = []
+    for height in heights:
+        paths.append(next_output_path(input_path, base_dir, [*taken, *paths], suffix, label=f"{height}p"))
+    return paths
+
+
+def upscale_file(input_path, output_path=None, size=None, scale=None, trace=False, ladder=None, **options):
+    started = time.perf_counter()
+    result = {"input": input_path, "output": None, "ok": False}
+    upscaler = None
+    try:
+        file_type = detect_file_type(input_path)
+        src_size = media_size(input_path, file_type)
+        if ladder:
+            # ladder - список (высота, путь); первая ступень - основной результат
+            heights, paths = zip(*ladder)
+            sizes = ladder_sizes(src_size, heights)
+            (width, height), output_path = sizes[0], paths[0]
+            options["ladder"] = [(w, h, path) for (w, h), path in zip(sizes[1:], paths[1:])]
+        else:
+            width, height = target_size(src_size, size, scale)
+        result.update(type=file_type, source=list(src_size), width=width, height=height)
+
+        output_path = output_path or next_output_path(input_path)
+        trace_path = f"{output_path}.trace.json" if trace else None
+        upscaler = Upscaler(input_path, output_path, width, height, file_type, trace_path=trace_path, **options)
+        result["output"] = upscaler.run()
+        if ladder:
+            result["renditions"] = [path for _, _, path in upscaler.renditions()]
+        result["frames"] = upscaler.telemetry.snapshot()["frames"]
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    if upscaler is not None:
+        # Профиль этапов есть и у упавшей задачи - по нему видно, где она застряла
+        result["stats"] = upscaler.stats
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def collect_files(patterns):
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(
+                str(p) for p in Path(pattern).iterdir()
+                if p.is_file() and p.suffix.lower() in MEDIA_EXTENSIONS
+            )
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(
+                p for p in glob.glob(pattern, recursive=True)
+                if os.path.isfile(p) and Path(p).suffix.lower() in MEDIA_EXTENSIONS
+            )
+        for path in matches:
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def parse_size(value):
+    try:
+        width, height = value.lower().split("x")
+        return int(width or 0), int(height or 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается ШИРИНАxВЫСОТА, получено {value!r}")
+
+
+def parse_ladder(value):
+    # "2160,1080,720,480" - высоты ступеней, от большей к меньшей
+    try:
+        heights = sorted({int(part) for part in str(value).replace(" ", "").split(",") if part}, reverse=True)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидаются высоты через запятую, например 2160,1080,720, получено {value!r}")
+    if not heights or heights[-1] <= 0:
+        raise argparse.ArgumentTypeError("высоты ступеней должны быть больше нуля")
+    return heights
+
+
+def parse_time(value):
+    # "90", "1:30" или "01:02:03.5" - секунды от начала видео
+    try:
+        seconds = 0.0
+        for part in str(value).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается время в секундах или ЧЧ:ММ:СС, получено {value!r}")
+    if seconds < 0:
+        raise argparse.ArgumentTypeError("время не может быть отрицательным")
+    return seconds
+
+
+def parse_target(value):
+    # "2" или "0.5" - множитель, "1920x1080" или "1920x0" - размер
+    value = str(value).strip()
+    if "x" in value.lower():
+        return parse_size(value), None
+    try:
+        scale = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается множитель или ШИРИНАxВЫСОТА, получено {value!r}")
+    if scale <= 0:
+        raise argparse.ArgumentTypeError("множитель должен быть больше нуля")
+    return None, scale
+
+
+def watch_folder(directory, output_dir, workers, image_format, options, ladder=None):
+    watcher = FolderWatcher(directory)
+    running = {}
+    print(json.dumps({
+        "watch": os.path.abspath(directory), "output": os.path.abspath(output_dir),
+        "inotify": watcher.inotify is not None
+    }, ensure_ascii=False), flush=True)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            try:
+                while True:
+                    for path in watcher.poll():
+                        taken = [output for _, outputs in running.values() for output in outputs]
+                        suffix = output_suffix(path, image_format)
+                        if ladder:
+                            outputs = ladder_output_paths(path, ladder, output_dir, taken, suffix)
+                            future = executor.submit(upscale_file, path, outputs[0], ladder=list(zip(ladder, outputs)), **options)
+                        else:
+                            outputs = [next_output_path(path, output_dir, taken, suffix)]
+                            future = executor.submit(upscale_file, path, outputs[0], **options)
+                        running[future] = (path, outputs)
+                    for future in [future for future in running if future.done()]:
+                        path, _ = running.pop(future)
+                        print(json.dumps(future.result(), ensure_ascii=False), flush=True)
+                        # Упавший файл тоже отмечаем: повторная попытка будет, только если он изменится
+                        watcher.mark_done(path)
+            except KeyboardInterrupt:
+                for future in running:
+                    future.cancel()
+    finally:
+        watcher.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="upscaler",
+        description="Пакетный апскейл изображений, GIF и видео без интерфейса"
+    )
+    parser.add_argument("inputs", nargs="*", help="файлы, папки или маски (*.png, **/*.mp4)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--size", type=parse_size, help="целевой размер, например 1920x1080 или 1920x0")
+    target.add_argument("--scale", type=float, help="множитель размера, например 2 или 0.5")
+    target.add_argument("--ladder", type=parse_ladder,
+                        help="несколько высот за один проход декодирования, например 2160,1080,720,480")
+    parser.add_argument("--start", type=parse_time, help="видео: начало фрагмента (секунды или ЧЧ:ММ:СС)")
+    parser.add_argument("--end", type=parse_time, help="видео: конец фрагмента (секунды или ЧЧ:ММ:СС)")
+    parser.add_argument("--start-frame", type=int, help="видео: первый кадр фрагмента (с нуля)")
+    parser.add_argument("--end-frame", type=int, help="видео: кадр, на котором фрагмент заканчивается (не включая его)")
+    parser.add_argument("--output-dir", help="папка для результатов (по умолчанию рядом с исходником)")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="следить за папкой и обрабатывать новые файлы (результаты - в DIR/Media Upscaler)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="сколько файлов обрабатывать одновременно")
+    parser.add_argument("--engine", choices=["auto", "ffmpeg", "opencv"], default="auto")
+    parser.add_argument("--decoder", choices=["auto", "ffmpeg", "opencv"], default="auto")
+    parser.add_argument("--codec", choices=list(VIDEO_CODECS), default="H.264")
+    parser.add_argument("--preset", choices=VIDEO_PRESETS, default="medium")
+    parser.add_argument("--parallel", action="store_true", help="видео по сегментам на всех ядрах")
+    parser.add_argument("--resumable", action="store_true", help="возобновлять прерванную обработку видео")
+    parser.add_argument("--dedupe", action="store_true", help="не пересчитывать повторяющиеся кадры")
+    parser.add_argument("--exact-downscale", dest="fast_downscale", action="store_false",
+                        help="уменьшать одним точным проходом, без draft JPEG, reduce() и пирамиды")
+    parser.add_argument("--format", choices=list(IMAGE_FORMATS), help="формат результата для картинок (по умолчанию как у исходника)")
+    parser.add_argument("--profile", choices=list(IMAGE_PROFILES), default="quality",
+                        help="профиль кодирования картинок: quality, fast, balanced или smallest")
+    parser.add_argument("--gif-engine", choices=GIF_ENGINES, default="shared",
+                        help="shared - одна палитра на всю анимацию, per-frame - своя палитра у каждого кадра")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="не брать готовые результаты из кэша и не сохранять их туда")
+    parser.add_argument("--cache-dir", help=f"папка кэша результатов (по умолчанию {default_cache_dir()})")
+    parser.add_argument("--cache-limit", type=float, default=CACHE_DEFAULT_LIMIT / 2**30,
+                        help="предельный размер кэша, ГБ; старые записи вытесняются")
+    parser.add_argument("--trace", action="store_true",
+                        help="сохранить рядом с результатом <имя>.trace.json (Chrome trace) с этапами обработки")
+    args = parser.parse_args(argv)
+
+    if args.scale is not None and args.scale <= 0:
+        parser.error("--scale должен быть больше нуля")
+    if (args.start is not None or args.end is not None) and (args.start_frame is not None or args.end_frame is not None):
+        parser.error("фрагмент задаётся либо временем (--start/--end), либо кадрами (--start-frame/--end-frame)")
+    if args.start_frame is not None and args.start_frame < 0:
+        parser.error("--start-frame не может быть отрицательным")
+
+    if args.watch:
+        if args.inputs:
+            parser.error("--watch не сочетается со списком файлов")
+        if not os.path.isdir(args.watch):
+            parser.error(f"папка {args.watch} не найдена")
+        args.output_dir = args.output_dir or os.path.join(args.watch, "Media Upscaler")
+        files = []
+    else:
+        files = collect_files(args.inputs)
+        if not files:
+            parser.error("не найдено ни одного медиафайла")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.format and not image_format_available(PIL_FORMATS[IMAGE_FORMATS[args.format]]):
+        parser.error(f"сохранение в {args.format} не поддерживается этой сборкой Pillow")
+
+    options = dict(
+        size=args.size, scale=args.scale,
+        parallel=args.parallel, codec=VIDEO_CODECS[args.codec], preset=args.preset,
+        engine=args.engine, decoder=args.decoder, resumable=args.resumable, dedupe=args.dedupe,
+        gif_engine=args.gif_engine, fast_downscale=args.fast_downscale, image_profile=args.profile,
+        cache=ResultCache(args.cache_dir, int(args.cache_limit * 2**30)) if args.cache else None,
+        start_time=args.start, end_time=args.end, start_frame=args.start_frame, end_frame=args.end_frame,
+        trace=args.trace
+    )
+    if args.watch:
+        return watch_folder(args.watch, args.output_dir, max(1, args.workers), args.format, options, args.ladder)
+
+    started = time.perf_counter()
+    failed = 0
+    workers = max(1, min(args.workers, len(files)))
+    # Имена результатов раздаём заранее: одноимённые файлы из разных папок,
+    # обрабатываемые одновременно, не должны писать в один и тот же результат
+    outputs = []
+    ladders = []
+    for path in files:
+        suffix = output_suffix(path, args.format)
+        if args.ladder:
+            taken = [output for ladder in ladders for _, output in ladder]
+            paths = ladder_output_paths(path, args.ladder, args.output_dir, taken, suffix)
+            ladders.append(list(zip(args.ladder, paths)))
+            outputs.append(paths[0])
+        else:
+            ladders.append(None)
+            outputs.append(next_output_path(path, args.output_dir, outputs, suffix))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(upscale_file, path, output, ladder=ladder, **options)
+            for path, output, ladder in zip(files, outputs, ladders)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            failed += not result["ok"]
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    summary = {
+        "summary": True,
+        "files": len(files),
+        "ok": len(files) - failed,
+        "failed": failed,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    print(json.dumps(summary, ensure_ascii=False), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())